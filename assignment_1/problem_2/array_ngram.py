@@ -0,0 +1,760 @@
+import random
+import numpy as np
+from itertools import islice
+from nltk.probability import FreqDist, ProbDistI
+
+from ngram import ml_estimator, estimator_name, ESTIMATORS
+from model_file import write_model_file, read_model_file
+
+
+# Id of the artificial symbols in the vocabulary of every ArrayNgram
+START_ID = 0
+END_ID   = 1
+# Packed context keys are stored as unsigned 64-bit integers
+KEY_BITS = 64
+# Number of words encoded and counted at once when training from a stream
+CHUNK_SIZE = 1000000
+# Size of chunk tables from which on they are merged into the running table
+MIN_MERGE_SIZE = 1000000
+
+
+def id_bits(vocab_size):
+    """
+    Number of bits needed to store one word id for a vocabulary of the given size.
+    """
+    return max(1, (vocab_size - 1).bit_length())
+
+def stream_bits(n):
+    """
+    Number of bits per word id used while the size of the vocabulary is not known yet,
+    the largest one for which contexts of n-grams fit into a key (ids are int32).
+    """
+    return min(31, KEY_BITS // max(n - 1, 1))
+
+def iter_chunks(words, chunk_size):
+    """
+    Split an iterable of words into lists of at most chunk_size words.
+    """
+    iterator = iter(words)
+    chunk = list(islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, chunk_size))
+
+def pack_ids(ids, bits):
+    """
+    Pack every row of a 2D array of word ids into one unsigned 64-bit key.
+    The first word of a row ends up in the most significant bits, so sorting
+    the keys sorts the rows lexicographically.
+    ...
+
+    Parameters:
+    -----------
+    ids : np.ndarray
+        2D array of word ids, one n-gram (or context) per row.
+    bits : int
+        Number of bits reserved for one word id.
+
+    Returns:
+    --------
+    keys : np.ndarray
+        1D array of packed keys (uint64), one per row.
+    """
+    keys = np.zeros(ids.shape[0], dtype=np.uint64)
+    for column in range(ids.shape[1]):
+        keys = (keys << np.uint64(bits)) | ids[:, column].astype(np.uint64)
+
+    return keys
+
+def unpack_keys(keys, width, bits):
+    """
+    Inverse of pack_ids, returns 2D array of word ids with width columns.
+    """
+    ids = np.empty((len(keys), width), dtype=np.int64)
+    mask = np.uint64((1 << bits) - 1)
+    for column in range(width - 1, -1, -1):
+        ids[:, column] = (keys & mask).astype(np.int64)
+        keys = keys >> np.uint64(bits)
+
+    return ids
+
+def count_ngrams(ids, n, bits):
+    """
+    Count all n-grams of an encoded (and already padded) word sequence.
+    ...
+
+    Parameters:
+    -----------
+    ids : np.ndarray
+        1D array of word ids.
+    n : int
+        Order of the n-grams.
+    bits : int
+        Number of bits reserved for one word id in packed context keys.
+
+    Returns:
+    --------
+    context_keys : np.ndarray
+        Sorted unique packed contexts (uint64).
+    offsets : np.ndarray
+        Array of len(context_keys)+1 offsets, outcomes of the i-th context
+        are stored in outcomes[offsets[i]:offsets[i+1]].
+    outcomes : np.ndarray
+        Word ids of outcomes, sorted within every context.
+    counts : np.ndarray
+        Count of every (context, outcome) pair.
+    """
+    if len(ids) < n:
+        return (np.zeros(0, dtype=np.uint64), np.zeros(1, dtype=np.int64),
+                np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64))
+
+    windows = np.lib.stride_tricks.sliding_window_view(ids, n)
+    keys = pack_ids(windows[:, :-1], bits)
+    outcomes = windows[:, -1]
+
+    # Sort by context first and by outcome second
+    order = np.lexsort((outcomes, keys))
+    keys = keys[order]
+    outcomes = outcomes[order]
+
+    return reduce_sorted(keys, outcomes, np.ones(len(keys), dtype=np.int64))
+
+def reduce_sorted(keys, outcomes, counts):
+    """
+    Sum counts of equal (context, outcome) pairs of arrays sorted by (context, outcome)
+    and group them by context. See count_ngrams for the returned arrays.
+    """
+    if len(keys) == 0:
+        return (np.zeros(0, dtype=np.uint64), np.zeros(1, dtype=np.int64),
+                np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64))
+
+    # A new pair starts where either context or outcome changes
+    new_pair = np.ones(len(keys), dtype=bool)
+    new_pair[1:] = (keys[1:] != keys[:-1]) | (outcomes[1:] != outcomes[:-1])
+    pair_starts = np.flatnonzero(new_pair)
+
+    pair_counts = np.add.reduceat(counts, pair_starts).astype(np.int64)
+    pair_keys = keys[pair_starts]
+    pair_outcomes = outcomes[pair_starts].astype(np.int32)
+
+    # A new context starts where the context changes
+    new_context = np.ones(len(pair_keys), dtype=bool)
+    new_context[1:] = pair_keys[1:] != pair_keys[:-1]
+    context_starts = np.flatnonzero(new_context)
+
+    offsets = np.append(context_starts, len(pair_keys)).astype(np.int64)
+
+    return pair_keys[context_starts], offsets, pair_outcomes, pair_counts
+
+def count_ngrams_streaming(chunks, n, bits, pad_left=True, pad_right=False):
+    """
+    Count all n-grams of a word sequence given as a stream of encoded chunks.
+    Only the last n-1 ids of the previous chunk and the counts are kept in memory,
+    chunk tables are merged into the running table from time to time.
+    ...
+
+    Parameters:
+    -----------
+    chunks : iterable(np.ndarray)
+        Consecutive parts of the (not padded) sequence of word ids.
+    n : int
+        Order of the n-grams.
+    bits : int
+        Number of bits reserved for one word id in packed context keys.
+    pad_left, pad_right : bool
+        Whether to add n-1 start/end symbols around the sequence.
+
+    Returns:
+    --------
+    Count table as returned by count_ngrams.
+    """
+    carry = np.full(n - 1 if pad_left else 0, START_ID, dtype=np.int32)
+    table = count_ngrams(carry[:0], n, bits)
+    pending = list()
+    pending_size = 0
+
+    for chunk in chunks:
+        sequence = np.concatenate((carry, chunk))
+        pending.append(count_ngrams(sequence, n, bits))
+        pending_size += len(pending[-1][2])
+        carry = sequence[max(len(sequence) - (n - 1), 0):] if n > 1 else sequence[:0]
+
+        # Merging costs the size of the running table, so it is done only when chunk tables grow as big
+        if pending_size > max(len(table[2]), MIN_MERGE_SIZE):
+            table = merge_count_tables([table] + pending)
+            pending.clear()
+            pending_size = 0
+
+    if pad_right:
+        pending.append(count_ngrams(np.concatenate((carry, np.full(n - 1, END_ID, dtype=np.int32))), n, bits))
+
+    return merge_count_tables([table] + pending)
+
+def merge_count_tables(tables):
+    """
+    Merge count tables (see count_ngrams) which use the same word ids.
+    """
+    keys = list()
+    outcomes = list()
+    counts = list()
+    for context_keys, offsets, table_outcomes, table_counts in tables:
+        # Every ngram gets the key of its context
+        keys.append(np.repeat(context_keys, np.diff(offsets)))
+        outcomes.append(table_outcomes)
+        counts.append(table_counts)
+
+    keys = np.concatenate(keys)
+    outcomes = np.concatenate(outcomes)
+    counts = np.concatenate(counts)
+    order = np.lexsort((outcomes, keys))
+
+    return reduce_sorted(keys[order], outcomes[order], counts[order])
+
+def repack_table(table, n, bits, new_bits):
+    """
+    Returns count table with context keys packed with new_bits bits per word id instead of bits.
+    """
+    context_keys, offsets, outcomes, counts = table
+
+    return pack_ids(unpack_keys(context_keys, n - 1, bits), new_bits), offsets, outcomes, counts
+
+
+class ArrayProbDist(ProbDistI):
+    """
+    Maximum likelihood distribution P(.|context) over a slice of the arrays of an ArrayNgram.
+    Outcomes are stored as sorted word ids, so prob is a binary search and
+    generate is a binary search over cumulative counts.
+    """
+
+    def __init__(self, vocab, word2id, outcomes, counts):
+        self._vocab = vocab
+        self._word2id = word2id
+        self._outcomes = outcomes
+        self._counts = counts
+        self._total = int(counts.sum())
+        self._cumulative = None
+
+    def prob(self, sample):
+        word_id = self._word2id.get(sample)
+        if word_id is None or self._total == 0:
+            return 0.0
+
+        index = np.searchsorted(self._outcomes, word_id)
+        if index < len(self._outcomes) and self._outcomes[index] == word_id:
+            return float(self._counts[index] / self._total)
+
+        return 0.0
+
+    def max(self):
+        return self._vocab[self._outcomes[np.argmax(self._counts)]]
+
+    def samples(self):
+        return [self._vocab[word_id] for word_id in self._outcomes]
+
+    def get_counts(self):
+        return self._counts
+
+    def freqdist(self):
+        return FreqDist(dict(zip(self.samples(), self._counts.tolist())))
+
+    def generate(self):
+        if self._total == 0:
+            raise ValueError("Can not sample from a context without outcomes!")
+
+        if self._cumulative is None:
+            self._cumulative = np.cumsum(self._counts)
+
+        index = np.searchsorted(self._cumulative, random.random() * self._total, side="right")
+
+        return self._vocab[self._outcomes[min(index, len(self._outcomes) - 1)]]
+
+    def __repr__(self):
+        return f"<ArrayProbDist with {len(self._outcomes)} samples>"
+
+
+class ArrayNgram:
+    """
+    Alternative storage backend for BasicNgram.
+    Words are interned to integer ids and n-gram counts are kept in sorted
+    NumPy arrays grouped by context, where a context is packed into one
+    unsigned 64-bit key. That avoids the dict/tuple overhead of ConditionalFreqDist
+    for higher order models.
+
+    It answers ngram[context], contexts() and get_n() the same way BasicNgram does,
+    so it can be passed to Generator instead of BasicNgram.
+
+    >>> corpus=['a','b','b','a']
+    >>> bigram=ArrayNgram(2,corpus)
+    >>> bigram.contexts()
+    [('<$>',), ('a',), ('b',)]
+    >>> bigram[('b',)].prob('a')
+    0.5
+
+    Note: (n-1) * id_bits(vocabulary size) has to fit into 64 bits.
+    """
+
+    def __init__(self, n, words, start_symbol="<$>", end_symbol="</$>", pad_left=True, pad_right=False, estimator=ml_estimator, chunk_size=CHUNK_SIZE):
+        """
+        Class constructor, parameters are the same as for BasicNgram.
+        Words can be any iterable, it is consumed as a stream in chunks of chunk_size words,
+        so only the current chunk and the counts are kept in memory.
+        """
+        assert (n > 0)
+        self._set_options(n, start_symbol, end_symbol, pad_left, pad_right, estimator)
+
+        # Artificial symbols always have the first two ids
+        self._word2id = {start_symbol: START_ID, end_symbol: END_ID}
+        # Vocabulary size is known only at the end, so keys are repacked then
+        bits = stream_bits(n)
+        chunks = (self._encode(chunk, bits) for chunk in iter_chunks(words, chunk_size))
+        table = count_ngrams_streaming(chunks, n, bits, pad_left, pad_right)
+        vocab = list(self._word2id)
+
+        self._set_counts(vocab, *repack_table(table, n, bits, id_bits(len(vocab))))
+
+    @classmethod
+    def from_ids(cls, n, vocab, ids, start_symbol="<$>", end_symbol="</$>", pad_left=True, pad_right=False, estimator=ml_estimator, chunk_size=CHUNK_SIZE):
+        """
+        Create a model from an already encoded corpus (e.g. a memory mapped snapshot, see corpus.py).
+        The first two words of vocab have to be the artificial symbols.
+        """
+        assert (n > 0)
+        if vocab[START_ID] != start_symbol or vocab[END_ID] != end_symbol:
+            raise ValueError("Vocabulary has to start with the artificial symbols of the model!")
+
+        bits = id_bits(len(vocab))
+        chunks = (np.asarray(ids[start:start+chunk_size], dtype=np.int32) for start in range(0, len(ids), chunk_size))
+        table = count_ngrams_streaming(chunks, n, bits, pad_left, pad_right)
+
+        return cls.from_counts(n, vocab, *table, start_symbol, end_symbol, pad_left, pad_right, estimator)
+
+    @classmethod
+    def from_counts(cls, n, vocab, context_keys, offsets, outcomes, counts, start_symbol="<$>", end_symbol="</$>", pad_left=True, pad_right=False, estimator=ml_estimator):
+        """
+        Create a model directly from count arrays (see count_ngrams), without a corpus.
+        The first two words of vocab have to be the artificial symbols.
+        """
+        assert (n > 0)
+        model = cls.__new__(cls)
+        model._set_options(n, start_symbol, end_symbol, pad_left, pad_right, estimator)
+        model._word2id = {word: word_id for word_id, word in enumerate(vocab)}
+        model._set_counts(vocab, context_keys, offsets, outcomes, counts)
+
+        return model
+
+    @classmethod
+    def from_basic(cls, basic_ngram):
+        """
+        Create a model with the same counts as a BasicNgram (NLTK backend).
+        """
+        n = basic_ngram.get_n()
+        counter = basic_ngram.get_counter()
+        start_symbol, end_symbol = basic_ngram.get_symbols()
+        word2id = {start_symbol: START_ID, end_symbol: END_ID}
+
+        contexts = list()
+        outcomes = list()
+        counts = list()
+        for context in counter.conditions():
+            context_ids = [word2id.setdefault(word, len(word2id)) for word in context]
+            for outcome, count in counter[context].items():
+                contexts.append(context_ids)
+                outcomes.append(word2id.setdefault(outcome, len(word2id)))
+                counts.append(count)
+
+        bits = id_bits(len(word2id))
+        keys = pack_ids(np.array(contexts, dtype=np.int64).reshape(len(contexts), n - 1), bits)
+        outcomes = np.array(outcomes, dtype=np.int32)
+        counts = np.array(counts, dtype=np.int64)
+        order = np.lexsort((outcomes, keys))
+
+        return cls.from_counts(n, list(word2id), *reduce_sorted(keys[order], outcomes[order], counts[order]),
+                               start_symbol, end_symbol, *basic_ngram.get_padding(), basic_ngram.get_estimator())
+
+    def _set_options(self, n, start_symbol, end_symbol, pad_left, pad_right, estimator):
+        self._n = n
+        self._start_symbol = start_symbol
+        self._end_symbol = end_symbol
+        self._pad_left = pad_left
+        self._pad_right = pad_right
+        self._estimator = estimator
+
+    def _set_counts(self, vocab, context_keys, offsets, outcomes, counts):
+        self._vocab = vocab
+        self._bits = id_bits(len(vocab))
+        self._check_key_size()
+
+        self._context_keys = context_keys
+        self._offsets = offsets
+        self._outcomes = outcomes
+        self._counts = counts
+
+        # Lower order model used for contexts removed by pruning
+        self._backoff = None
+
+        # Built on demand by the batch and scoring API
+        self._cumulative = None
+        self._vocab_array = None
+        self._pair_keys = None
+        self._context_totals = None
+
+    def _encode(self, words, bits):
+        """
+        Intern words into ids, new words get the next free id.
+        """
+        word2id = self._word2id
+        ids = np.fromiter((word2id.setdefault(word, len(word2id)) for word in words), dtype=np.int32)
+        if len(word2id) > (1 << bits):
+            raise ValueError(f"Vocabulary of a {self._n}-gram model can not have more than {1 << bits} words!")
+
+        return ids
+
+    def _check_key_size(self):
+        if (self._n - 1) * self._bits > KEY_BITS:
+            raise ValueError(f"Contexts of a {self._n}-gram model with {len(self._vocab)} words "
+                             f"do not fit into {KEY_BITS}-bit keys!")
+
+    def _context_index(self, context):
+        """
+        Returns the position of a context in context_keys, or None if the context was never seen.
+        """
+        if len(context) != self._n - 1:
+            return None
+
+        ids = [self._word2id.get(word) for word in context]
+        if None in ids:
+            return None
+
+        key = pack_ids(np.array([ids], dtype=np.int64).reshape(1, -1), self._bits)[0]
+        index = np.searchsorted(self._context_keys, key)
+        if index < len(self._context_keys) and self._context_keys[index] == key:
+            return index
+
+        return None
+
+    def __getitem__(self, context):
+        index = self._context_index(context)
+
+        # Pruned models back off to the lower order model for removed contexts
+        if index is None and self._backoff is not None and len(context) == self._n - 1:
+            return self._backoff[context[1:]]
+
+        if index is None:
+            outcomes = np.zeros(0, dtype=np.int32)
+            counts = np.zeros(0, dtype=np.int64)
+        else:
+            outcomes = self._outcomes[self._offsets[index]:self._offsets[index+1]]
+            counts = self._counts[self._offsets[index]:self._offsets[index+1]]
+
+        prob_dist = ArrayProbDist(self._vocab, self._word2id, outcomes, counts)
+        if self._estimator is ml_estimator:
+            return prob_dist
+
+        return self._estimator(prob_dist.freqdist())
+
+    def __contains__(self, context):
+        return self._context_index(context) is not None
+
+    ###########################
+    # BATCH (VECTORIZED) API  #
+    ###########################
+
+    def encode_contexts(self, contexts):
+        """
+        Returns packed keys (uint64) of a list of contexts, all words have to be in the vocabulary.
+        """
+        ids = np.array([[self._word2id[word] for word in context] for context in contexts], dtype=np.int64)
+
+        return pack_ids(ids.reshape(len(contexts), self._n - 1), self._bits)
+
+    def decode_ids(self, ids):
+        """
+        Returns array of words (objects) of the same shape as the array of word ids.
+        """
+        if self._vocab_array is None:
+            self._vocab_array = np.array(self._vocab, dtype=object)
+
+        return self._vocab_array[ids]
+
+    def find_contexts(self, keys):
+        """
+        Returns positions of packed contexts in context_keys, -1 for contexts that were never seen.
+        """
+        indices = np.searchsorted(self._context_keys, keys)
+        found = indices < len(self._context_keys)
+        found[found] = self._context_keys[indices[found]] == keys[found]
+
+        return np.where(found, indices, -1)
+
+    def sample_outcomes(self, indices, rng):
+        """
+        Sample one outcome for every context at the given positions in a single vectorized step.
+        An integer in [0, count of the context) is drawn for every context and
+        looked up in the cumulative counts of the whole model.
+        ...
+
+        Parameters:
+        -----------
+        indices : np.ndarray
+            Positions of contexts (must be found ones).
+        rng : np.random.Generator
+            Source of randomness.
+
+        Returns:
+        --------
+        np.ndarray
+            Word ids of sampled outcomes.
+        """
+        if self._cumulative is None:
+            self._cumulative = np.concatenate(([0], np.cumsum(self._counts)))
+
+        lower = self._cumulative[self._offsets[indices]]
+        upper = self._cumulative[self._offsets[indices + 1]]
+        draws = lower + rng.integers(0, upper - lower)
+        positions = np.searchsorted(self._cumulative, draws, side="right") - 1
+
+        return self._outcomes[positions]
+
+    def shift_contexts(self, keys, ids):
+        """
+        Returns packed contexts after appending a word to every context and dropping its first word.
+        """
+        mask = np.uint64((1 << ((self._n - 1) * self._bits)) - 1)
+
+        return ((keys << np.uint64(self._bits)) | ids.astype(np.uint64)) & mask
+
+    ###########################
+    # SCORING                 #
+    ###########################
+
+    def encode_windows(self, tokens):
+        """
+        Returns 2D array of word ids of all ngrams of the tokens, padded the same way
+        generate_ngrams of BasicNgram pads. Unknown words get id -1.
+        """
+        word2id = self._word2id
+        ids = np.fromiter((word2id.get(token, -1) for token in tokens), dtype=np.int64)
+        left = np.full(self._n - 1 if self._pad_left else 0, START_ID, dtype=np.int64)
+        right = np.full(self._n - 1 if self._pad_right else 0, END_ID, dtype=np.int64)
+        ids = np.concatenate((left, ids, right))
+        if len(ids) < self._n:
+            return np.zeros((0, self._n), dtype=np.int64)
+
+        return np.lib.stride_tricks.sliding_window_view(ids, self._n)
+
+    def window_logprobs(self, windows):
+        """
+        Returns natural log-probabilities log P(last word | context) of encoded ngrams (see encode_windows).
+        Lookups are vectorized: contexts are found by binary search over packed context keys,
+        outcomes by binary search over (context position, outcome) pairs.
+        Ngrams with unknown words or unseen in training get -inf (maximum likelihood),
+        unless the model has a backoff model, which then scores them without the first context word.
+        Smoothing estimators also score unknown outcomes of found contexts, the same as prob of their distribution.
+        """
+        logprobs = np.full(len(windows), -np.inf)
+        known = (windows[:, :-1] >= 0).all(axis=1)
+        indices = np.full(len(windows), -1, dtype=np.int64)
+        indices[known] = self.find_contexts(pack_ids(windows[known, :-1], self._bits))
+        found = indices >= 0
+
+        if self._estimator is not ml_estimator:
+            logprobs = self._estimator_logprobs(windows, indices, found, logprobs)
+        else:
+            logprobs = self._ml_logprobs(windows, indices, found, logprobs)
+
+        if self._backoff is not None:
+            unseen = np.isneginf(logprobs) & (windows[:, -1] >= 0)
+            logprobs[unseen] = self._backoff.window_logprobs(windows[unseen, 1:])
+
+        return logprobs
+
+    def _ml_logprobs(self, windows, indices, found, logprobs):
+        if self._pair_keys is None:
+            sizes = np.diff(self._offsets)
+            self._pair_keys = np.repeat(np.arange(len(sizes), dtype=np.int64), sizes) * len(self._vocab) + self._outcomes
+            self._context_totals = np.add.reduceat(self._counts, self._offsets[:-1]) if len(sizes) else np.zeros(0, dtype=np.int64)
+
+        pair_keys = indices[found] * len(self._vocab) + windows[found, -1]
+        positions = np.searchsorted(self._pair_keys, pair_keys)
+        positions = np.minimum(positions, len(self._pair_keys) - 1)
+        seen = (self._pair_keys[positions] == pair_keys) & (windows[found, -1] >= 0)
+
+        with np.errstate(divide="ignore"):
+            probs = np.where(seen, self._counts[positions] / self._context_totals[indices[found]], 0.0)
+            logprobs[found] = np.log(probs)
+
+        return logprobs
+
+    def _estimator_logprobs(self, windows, indices, found, logprobs):
+        """
+        Smoothing estimators can not be vectorized, so their distribution is built once per distinct context
+        and asked once per distinct (context, word) pair.
+        """
+        pairs, inverse = np.unique(np.stack((indices[found], windows[found, -1]), axis=1), axis=0, return_inverse=True)
+        pair_logprobs = np.empty(len(pairs))
+        prob_dist = None
+        last_index = -1
+        for pair, (index, word_id) in enumerate(pairs):
+            if index != last_index:
+                prob_dist = self[self.decode_contexts(self._context_keys[index:index+1])[0]]
+                last_index = index
+            # Unknown word (id -1) has zero count in every context, as None has
+            prob = prob_dist.prob(self._vocab[word_id] if word_id >= 0 else None)
+            pair_logprobs[pair] = np.log(prob) if prob > 0 else -np.inf
+
+        logprobs[found] = pair_logprobs[inverse.reshape(-1)]
+
+        return logprobs
+
+    def logprobs(self, tokens):
+        """
+        Returns array of natural log-probabilities of every ngram of the tokens (one per token,
+        plus one per end symbol if pad_right).
+        """
+        return self.window_logprobs(self.encode_windows(tokens))
+
+    def score(self, tokens):
+        """
+        Score held-out tokens against the model.
+        ...
+
+        Parameters:
+        -----------
+        tokens : list(str) or np.ndarray
+            Words to be scored.
+
+        Returns:
+        --------
+        logprobs : np.ndarray
+            Natural log-probability of every ngram of the tokens.
+        perplexity : float
+            exp of the negative mean log-probability, inf if some ngram has zero probability.
+        """
+        logprobs = self.logprobs(tokens)
+        if len(logprobs) == 0:
+            return logprobs, float("nan")
+
+        return logprobs, float(np.exp(-logprobs.mean()))
+
+    def __len__(self):
+        return len(self._context_keys)
+
+    def conditions(self):
+        return self.decode_contexts(self._context_keys)
+
+    def decode_contexts(self, keys):
+        """
+        Returns list of contexts (tuples of words) of packed context keys.
+        """
+        ids = unpack_keys(keys, self._n - 1, self._bits)
+
+        return [tuple(self._vocab[word_id] for word_id in row) for row in ids]
+
+    def prefixed_context_keys(self, first_words):
+        """
+        Returns packed keys of all contexts that start with one of the given words.
+        The first word is stored in the most significant bits of a key, so contexts
+        with the same first word form a contiguous range found by binary search.
+        """
+        assert self._n > 1
+        shift = (self._n - 2) * self._bits
+        ranges = list()
+
+        for word in first_words:
+            word_id = self._word2id.get(word)
+            if word_id is None:
+                continue
+
+            lower = np.searchsorted(self._context_keys, np.uint64(word_id << shift))
+            upper = np.searchsorted(self._context_keys, np.uint64((word_id + 1) << shift)) if word_id + 1 < (1 << self._bits) \
+                    else len(self._context_keys)
+            ranges.append(self._context_keys[lower:upper])
+
+        return np.concatenate(ranges) if ranges else np.zeros(0, dtype=np.uint64)
+
+    def prefixed_contexts(self, first_words):
+        """
+        Returns list of all contexts that start with one of the given words.
+        """
+        return self.decode_contexts(self.prefixed_context_keys(first_words))
+
+    def contexts(self):
+        return self.conditions()
+
+    def get_n(self):
+        return self._n
+
+    ###########################
+    # PERSISTENCE             #
+    ###########################
+
+    def save(self, path):
+        """
+        Save the model into a binary model file (see model_file.py).
+        """
+        header = {"n": self._n,
+                  "start_symbol": self._start_symbol,
+                  "end_symbol": self._end_symbol,
+                  "pad_left": self._pad_left,
+                  "pad_right": self._pad_right,
+                  "estimator": estimator_name(self._estimator),
+                  "vocab": self._vocab}
+        arrays = {"context_keys": self._context_keys,
+                  "offsets": self._offsets,
+                  "outcomes": self._outcomes,
+                  "counts": self._counts}
+
+        write_model_file(path, header, arrays)
+
+    @classmethod
+    def load(cls, path, use_mmap=True):
+        """
+        Load a model from a binary model file.
+        With use_mmap count arrays are memory mapped read-only, so loading is near-instant
+        and all processes which load the same file share one page-cached copy.
+        """
+        header, arrays = read_model_file(path, use_mmap)
+
+        return cls.from_counts(header["n"], header["vocab"],
+                               arrays["context_keys"], arrays["offsets"], arrays["outcomes"], arrays["counts"],
+                               header["start_symbol"], header["end_symbol"],
+                               header["pad_left"], header["pad_right"],
+                               ESTIMATORS[header["estimator"]])
+
+    def set_backoff(self, model):
+        """
+        Set a lower order model (with the same vocabulary) used for contexts and ngrams this model does not have.
+        Backoff is not discounted, so probabilities of backed off ngrams are only an approximation.
+        """
+        assert model.get_n() == self._n - 1 and model.get_vocab() == self._vocab
+        self._backoff = model
+
+    def get_backoff(self):
+        return self._backoff
+
+    def get_count_table(self):
+        """
+        Returns count arrays (context_keys, offsets, outcomes, counts), see count_ngrams.
+        """
+        return self._context_keys, self._offsets, self._outcomes, self._counts
+
+    def get_bits(self):
+        return self._bits
+
+    def get_vocab(self):
+        return self._vocab
+
+    def get_symbols(self):
+        return self._start_symbol, self._end_symbol
+
+    def get_padding(self):
+        return self._pad_left, self._pad_right
+
+    def get_estimator(self):
+        return self._estimator
+
+    def nbytes(self):
+        """
+        Memory used by the count arrays in bytes (vocabulary excluded).
+        """
+        return self._context_keys.nbytes + self._offsets.nbytes + self._outcomes.nbytes + self._counts.nbytes
@@ -0,0 +1,146 @@
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+import argparse
+import subprocess
+from nltk.util import ngrams
+
+from ngram import BasicNgram
+from array_ngram import ArrayNgram
+from generator import Generator
+
+
+"""
+Helper script to compare the storage backends and the generation speed of ngram models.
+IMPORTANT: It is not used by main.py, only for measuring purpose.
+"""
+
+BACKENDS = {"nltk": BasicNgram, "array": ArrayNgram}
+
+
+def load_corpus(corpus):
+    """
+    Returns list of words of the reuters corpus, or of a plain text file split on whitespace.
+    """
+    if corpus == "reuters":
+        from nltk.corpus import reuters
+
+        return list(reuters.words())
+
+    with open(corpus, 'r', encoding="utf-8") as corpus_file:
+        return corpus_file.read().split()
+
+def train(args):
+    """
+    Train one model and print memory allocated by it (traced by tracemalloc, numpy arrays included).
+    Only allocations made while training are traced, so the corpus is not counted.
+    Run in a fresh process for every model, so measurements do not influence each other.
+    """
+    words = load_corpus(args.corpus)
+    tracemalloc.start()
+    start_time = time.time()
+    model = BACKENDS[args.backend](args.ngram, words)
+    train_time = time.time() - start_time
+    model_size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{model_size / 2**20:.1f}\t{peak / 2**20:.1f}\t{train_time:.2f}\t{len(model.contexts())}")
+
+def memory(args):
+    """
+    Report memory of models of both backends for n=1..max_n: size of the trained model
+    and peak memory allocated while training it.
+    """
+    print("backend\tn\tmodel MB\ttraining peak MB\ttrain sec\tcontexts")
+    for n in range(1, args.max_n + 1):
+        for backend in BACKENDS:
+            output = subprocess.run([sys.executable, __file__, "train", str(n), "-backend", backend, "-corpus", args.corpus],
+                                    capture_output=True, text=True, check=True).stdout
+            model_size, peak, train_time, contexts = output.split()
+            print(f"{backend}\t{n}\t{model_size}\t{peak}\t{train_time}\t{contexts}")
+
+def generation(args):
+    """
+    Report generation speed in tokens per second with and without alias samplers for n=1..max_n.
+    """
+    words = load_corpus(args.corpus)
+    num_of_tokens = args.ntexts * args.nwords
+
+    print("n\tlinear tok/s\talias tok/s\tspeedup")
+    with tempfile.TemporaryDirectory() as texts_dir:
+        for n in range(1, args.max_n + 1):
+            # Corpus is wrapped around, so that the last context of the corpus
+            # has a continuation and long runs do not get stuck in it
+            model = BACKENDS[args.backend](n, words + words[:n-1])
+            speeds = list()
+
+            for cache_size in (0, args.cache_size):
+                generator = Generator(model, texts_dir, sampler_cache_size=cache_size)
+                start_time = time.time()
+                generator.generate(args.ntexts, args.nwords, True, "generated.txt")
+                speeds.append(num_of_tokens / (time.time() - start_time))
+                os.remove(os.path.join(texts_dir, "generated.txt"))
+
+            print(f"{n}\t{speeds[0]:.0f}\t{speeds[1]:.0f}\t{speeds[1] / speeds[0]:.1f}x")
+
+def scoring(args):
+    """
+    Report scoring throughput in tokens per second of per-token NLTK lookups and of the vectorized API.
+    Model is trained on the first part of the corpus and scores the rest (held-out).
+    """
+    words = load_corpus(args.corpus)
+    split = int(len(words) * args.train_part)
+    train_words, test_words = words[:split], words[split:]
+
+    print("n\tper-token tok/s\tvectorized tok/s\theld-out perplexity\ttrain perplexity")
+    for n in range(1, args.max_n + 1):
+        model = BasicNgram(n, train_words)
+        model.score(test_words[:n])
+
+        start_time = time.time()
+        for ngram in ngrams(test_words, n, True, False, left_pad_symbol="<$>", right_pad_symbol="</$>"):
+            if ngram[:-1] in model:
+                model[ngram[:-1]].prob(ngram[-1])
+        per_token_speed = len(test_words) / (time.time() - start_time)
+
+        start_time = time.time()
+        _, perplexity = model.score(test_words)
+        vectorized_speed = len(test_words) / (time.time() - start_time)
+
+        print(f"{n}\t{per_token_speed:.0f}\t{vectorized_speed:.0f}\t{perplexity:.2f}\t{model.score(train_words)[1]:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for ngram models.")
+    subparsers = parser.add_subparsers(dest="task", required=True)
+
+    train_parser = subparsers.add_parser("train", help="Train one model and report its memory")
+    train_parser.add_argument("ngram", metavar='n', type=int, help="N for ngram model")
+    train_parser.add_argument("-backend", default="nltk", choices=BACKENDS, help="Storage backend of the model")
+    train_parser.add_argument("-corpus", default="reuters", type=str, help="reuters or path to a plain text file")
+    train_parser.set_defaults(func=train)
+
+    memory_parser = subparsers.add_parser("memory", help="Compare memory of models of the backends")
+    memory_parser.add_argument("-max_n", default=4, type=int, help="Highest order of ngram models")
+    memory_parser.add_argument("-corpus", default="reuters", type=str, help="reuters or path to a plain text file")
+    memory_parser.set_defaults(func=memory)
+
+    generation_parser = subparsers.add_parser("generation", help="Compare generation speed with and without alias samplers")
+    generation_parser.add_argument("-max_n", default=4, type=int, help="Highest order of ngram models")
+    generation_parser.add_argument("-corpus", default="reuters", type=str, help="reuters or path to a plain text file")
+    generation_parser.add_argument("-backend", default="nltk", choices=BACKENDS, help="Storage backend of the models")
+    generation_parser.add_argument("-ntexts", default=100, type=int, help="Number of texts to be generated")
+    generation_parser.add_argument("-nwords", default=100, type=int, help="Number of words per text to be generated")
+    generation_parser.add_argument("-cache_size", default=100000, type=int, help="Size of the cache of samplers")
+    generation_parser.set_defaults(func=generation)
+
+    scoring_parser = subparsers.add_parser("scoring", help="Compare per-token and vectorized scoring speed")
+    scoring_parser.add_argument("-max_n", default=4, type=int, help="Highest order of ngram models")
+    scoring_parser.add_argument("-corpus", default="reuters", type=str, help="reuters or path to a plain text file")
+    scoring_parser.add_argument("-train_part", default=0.9, type=float, help="Part of the corpus used for training")
+    scoring_parser.set_defaults(func=scoring)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,108 @@
+import os
+import re
+import json
+import numpy as np
+
+from array_ngram import START_ID, END_ID, CHUNK_SIZE, iter_chunks
+
+
+"""
+Streaming corpora for training ngram models.
+
+TextCorpus streams words from plain text files through a regex tokenizer.
+SnapshotCorpus reads a tokenized snapshot: words encoded as int32 ids in a raw
+file (<path>.ids, memory mapped) and the vocabulary in <path>.vocab.json.
+Both can be iterated more than once and never hold the whole corpus in memory.
+"""
+
+# The same pattern as WordPunctTokenizer that reuters corpus reader uses
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]+")
+IDS_SUFFIX    = ".ids"
+VOCAB_SUFFIX  = ".vocab.json"
+
+
+class TextCorpus:
+    """
+    Words of a text file, or of all files in a directory (recursively, sorted by path).
+    """
+
+    def __init__(self, path):
+        self._path = path
+
+    def get_files(self):
+        if os.path.isfile(self._path):
+            return [self._path]
+
+        files = list()
+        for root, _, names in os.walk(self._path):
+            files.extend(os.path.join(root, name) for name in names)
+
+        return sorted(files)
+
+    def __iter__(self):
+        for file_path in self.get_files():
+            with open(file_path, 'r', encoding="utf-8-sig", errors="replace") as text_file:
+                for line in text_file:
+                    yield from TOKEN_PATTERN.findall(line)
+
+
+class SnapshotCorpus:
+    """
+    Words of a tokenized snapshot written by write_snapshot.
+    """
+
+    def __init__(self, path):
+        with open(path + VOCAB_SUFFIX, 'r', encoding="utf-8") as vocab_file:
+            self._vocab = json.load(vocab_file)
+        self._ids = np.memmap(path + IDS_SUFFIX, dtype=np.int32, mode='r')
+
+    def get_vocab(self):
+        return self._vocab
+
+    def get_ids(self):
+        return self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        for start in range(0, len(self._ids), CHUNK_SIZE):
+            yield from (self._vocab[word_id] for word_id in self._ids[start:start+CHUNK_SIZE])
+
+
+def snapshot_exists(path):
+    return os.path.isfile(path + IDS_SUFFIX) and os.path.isfile(path + VOCAB_SUFFIX)
+
+def write_snapshot(path, words, start_symbol="<$>", end_symbol="</$>", chunk_size=CHUNK_SIZE):
+    """
+    Encode a stream of words into ids and write them as a snapshot, chunk by chunk.
+    The artificial symbols get the first two ids, so the snapshot can be used with ArrayNgram.from_ids.
+    ...
+
+    Parameters:
+    -----------
+    path : str
+        Path prefix of snapshot files.
+    words : iterable
+        Stream of words, e.g. TextCorpus or reuters.words().
+    start_symbol, end_symbol : str, optional
+        Artificial symbols of models trained from the snapshot.
+    chunk_size : int, optional
+        Number of words encoded and written at once.
+
+    Returns:
+    --------
+    SnapshotCorpus
+        The written snapshot.
+    """
+    word2id = {start_symbol: START_ID, end_symbol: END_ID}
+
+    with open(path + IDS_SUFFIX, 'wb') as ids_file:
+        for chunk in iter_chunks(words, chunk_size):
+            ids = np.fromiter((word2id.setdefault(word, len(word2id)) for word in chunk), dtype=np.int32)
+            ids.tofile(ids_file)
+
+    with open(path + VOCAB_SUFFIX, 'w', encoding="utf-8") as vocab_file:
+        json.dump(list(word2id), vocab_file)
+
+    return SnapshotCorpus(path)
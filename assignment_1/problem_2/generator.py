@@ -1,9 +1,129 @@
 import os
+import random
+import numpy as np
 from nltk.probability import UniformProbDist
 
+from lru import LRUCache
+from ngram import ml_estimator
+from array_ngram import ArrayNgram, ArrayProbDist, unpack_keys
+
 
 # Token for unigram model to be used as context.
 NO_CONTEXT = ()
+# Default number of contexts whose samplers are kept in memory.
+SAMPLER_CACHE_SIZE = 100000
+# Highest order of nltk backed models sampled through alias tables by default,
+# higher orders have few outcomes per context and direct sampling is faster.
+ALIAS_MAX_N = 2
+
+
+class AliasSampler:
+    """
+    Walker's alias table for sampling from a discrete distribution in O(1).
+    The table is built once in O(k) for k outcomes. Sampling picks a column
+    uniformly and then either the column's own outcome or its alias.
+    """
+
+    def __init__(self, samples, weights):
+        """
+        Class constructor.
+        ...
+
+        Parameters:
+        -----------
+        samples : list
+            Outcomes of the distribution.
+        weights : list
+            Probabilities (or counts) of the outcomes, do not need to be normalized.
+        """
+        self._samples = list(samples)
+        size = len(self._samples)
+        if size == 0:
+            raise ValueError("Can not sample from a context without outcomes!")
+
+        # Like ProbDistI.generate, a distribution which sums to zero gives an arbitrary sample
+        total = sum(weights)
+        if not total > 0:
+            weights = [1.0] * size
+            total = float(size)
+
+        # Probabilities scaled so that the average column is exactly full
+        scaled = [weight * size / total for weight in weights]
+        self._threshold = [1.0] * size
+        self._alias = list(range(size))
+
+        small = [i for i, prob in enumerate(scaled) if prob < 1.0]
+        large = [i for i, prob in enumerate(scaled) if prob >= 1.0]
+
+        # Vose's method: fill every underfull column with the rest from an overfull one
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+
+            self._threshold[less] = scaled[less]
+            self._alias[less] = more
+
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+
+        # Leftovers are full up to rounding errors
+        for i in small + large:
+            self._threshold[i] = 1.0
+
+    def generate(self):
+        column = random.randrange(len(self._samples))
+        if random.random() < self._threshold[column]:
+            return self._samples[column]
+
+        return self._samples[self._alias[column]]
+
+class ContextSampler:
+    """
+    Sampler of one context which builds its alias table only when the context is visited again.
+    Most contexts of high order models are visited once, and for them the O(k) table
+    would never be paid back, so the first sample is drawn directly from the distribution.
+    """
+
+    def __init__(self, prob_dist):
+        """
+        Class constructor.
+        ...
+
+        Parameters:
+        -----------
+        prob_dist : ProbDistI
+            Distribution of the next word for the context.
+        """
+        self._prob_dist = prob_dist
+        self._visited = False
+        self._alias = None
+
+    def _build_alias(self):
+        prob_dist = self._prob_dist
+
+        # Array backed distributions give counts directly, without a lookup per sample
+        if isinstance(prob_dist, ArrayProbDist):
+            return AliasSampler(prob_dist.samples(), prob_dist.get_counts().tolist())
+
+        samples = list(prob_dist.samples())
+
+        return AliasSampler(samples, [prob_dist.prob(sample) for sample in samples])
+
+    def generate(self):
+        if self._alias is not None:
+            return self._alias.generate()
+
+        if not self._visited:
+            self._visited = True
+
+            return self._prob_dist.generate()
+
+        self._alias = self._build_alias()
+
+        return self._alias.generate()
 
 class Generator:
     """
@@ -12,7 +132,7 @@ class Generator:
     For the unigram model, this step is omitted and sampling is done by using the NO_CONTEXT token for context.
     """
 
-    def __init__(self, model, texts_dir):
+    def __init__(self, model, texts_dir, sampler_cache_size=None):
         """
         Class constructor.
         ...
@@ -23,8 +143,18 @@ class Generator:
             Trained ngram model for sampling.
         texts_dir : str, optional
             Specify in which directory to find/create files for writing generated texts.
+        sampler_cache_size : int, optional
+            Maximum number of contexts for which samplers are kept, alias tables are built
+            on the second visit of a context. If 0, program samples directly from the model's distributions (linear scan).
+            If None, SAMPLER_CACHE_SIZE is used for array backed models and for other models up to ALIAS_MAX_N,
+            and 0 for higher orders, where alias tables do not pay off.
         """
         self._ngram_model = model
+        if sampler_cache_size is None:
+            use_alias = isinstance(model, ArrayNgram) or model.get_n() <= ALIAS_MAX_N
+            sampler_cache_size = SAMPLER_CACHE_SIZE if use_alias else 0
+        # Samplers are created the first time a context is visited
+        self._samplers = LRUCache(sampler_cache_size) if sampler_cache_size else None
         # Path is: current working directory + path to directory
         self._texts_path = os.path.join(os.path.abspath(''), texts_dir)
 
@@ -45,11 +175,31 @@ class Generator:
         """
 
         # Titles are all uppercase, so program will choose only such contexts to start the text.
-        incipts = [context for context in self._ngram_model.contexts() if context[0].isupper()]
+        # Models with sorted contexts find them by a prefix lookup for every uppercase word
+        # in the vocabulary, other models have to scan all contexts.
+        if hasattr(self._ngram_model, "prefixed_contexts"):
+            uppercase_words = [word for word in self._ngram_model.get_vocab() if word.isupper()]
+            incipts = self._ngram_model.prefixed_contexts(uppercase_words)
+        else:
+            incipts = [context for context in self._ngram_model.contexts() if context[0].isupper()]
+
+        if len(incipts) == 0:
+            raise ValueError("The model has no contexts starting with an uppercase word to start texts from (is it pruned too much?)")
         incipts_prob = UniformProbDist(incipts)
 
         return incipts_prob
 
+    def _new_sampler(self, context):
+        return ContextSampler(self._ngram_model[context])
+
+    def _sample(self, context):
+        """
+        Method to sample the next word for the context.
+        """
+        if self._samplers is None:
+            return self._ngram_model[context].generate()
+
+        return self._samplers.get(context, self._new_sampler).generate()
 
     def generate(self, num_of_texts, num_of_words, to_file, file_name):
         """
@@ -77,6 +227,99 @@ class Generator:
         
         return True
     
+    def generate_batch(self, num_of_texts, num_of_words, to_file, file_name, seed=None):
+        """
+        Batch version of the generate method, which generates all texts in lockstep.
+        Contexts of all texts are stored in one array of packed contexts, and the next word
+        for every text is sampled in a single vectorized step. Requires ArrayNgram model with ml estimator.
+        Contexts which pruned models do not have back off to the lower order models, as in model[context].
+        A text which ends up in a context without outcomes continues from a random incipt.
+        ...
+
+        Parameters:
+        -----------
+        num_of_texts : int
+            Specify how many texts to be generated.
+        num_of_words : int
+            Specify how many words per text to be generated.
+        to_file : bool
+            Flag that indicates where to write generated texts. If False, text will be printed in terminal.
+        file_name : str
+            Name of a file where generated texts will be written.
+        seed : int, optional
+            Seed for random generator, the same seed gives the same texts.
+        """
+        if not isinstance(self._ngram_model, ArrayNgram):
+            raise TypeError("Batch generation requires the array backend (ArrayNgram)!")
+        if self._ngram_model.get_estimator() is not ml_estimator:
+            raise ValueError("Batch generation samples from counts and requires the ml estimator!")
+
+        rng = np.random.default_rng(seed)
+        model = self._ngram_model
+        n = model.get_n()
+        # Every row is one text
+        text_ids = np.empty((num_of_texts, num_of_words), dtype=np.int64)
+
+        if n == 1:
+            # Unigram model has only one (empty) context
+            incipt_keys = np.zeros(1, dtype=np.uint64)
+            contexts = np.zeros(num_of_texts, dtype=np.uint64)
+            start = 0
+        else:
+            incipt_keys = model.encode_contexts(list(self._incipts.samples()))
+            contexts = incipt_keys[rng.integers(0, len(incipt_keys), num_of_texts)]
+            start = min(n - 1, num_of_words)
+            text_ids[:, :start] = unpack_keys(contexts, n - 1, model.get_bits())[:, :start]
+
+        for position in range(start, num_of_words):
+            next_ids = self._sample_batch(model, contexts, rng)
+
+            # Texts in contexts without outcomes continue from a random incipt
+            dead_ends = next_ids < 0
+            if dead_ends.any():
+                contexts[dead_ends] = incipt_keys[rng.integers(0, len(incipt_keys), dead_ends.sum())]
+                next_ids[dead_ends] = self._sample_batch(model, contexts[dead_ends], rng)
+
+            text_ids[:, position] = next_ids
+            contexts = model.shift_contexts(contexts, next_ids)
+
+        # Add borders above and below every text
+        hline = '-' * 50
+        texts = "".join(f"\n{hline}\n{' '.join(words)}\n{hline}\n" for words in model.decode_ids(text_ids))
+
+        if not to_file:
+            print(texts)
+
+            return True
+
+        file_path = os.path.join(self._texts_path, file_name)
+        try:
+            with open(file_path, "a+") as text_file:
+                text_file.write(texts)
+        except FileNotFoundError:
+            print("File couldn't be open! Check file/directory path.")
+
+            return False
+
+        return True
+
+    def _sample_batch(self, model, contexts, rng):
+        """
+        Returns sampled word ids for packed contexts, -1 for contexts without outcomes.
+        Contexts the model does not have are sampled from its backoff model without their first word.
+        """
+        next_ids = np.full(len(contexts), -1, dtype=np.int64)
+        indices = model.find_contexts(contexts)
+        found = indices >= 0
+        next_ids[found] = model.sample_outcomes(indices[found], rng)
+
+        backoff = model.get_backoff()
+        if backoff is not None and not found.all():
+            mask = np.uint64((1 << ((backoff.get_n() - 1) * backoff.get_bits())) - 1)
+            next_ids[~found] = self._sample_batch(backoff, contexts[~found] & mask, rng)
+
+        return next_ids
+
     def generate_text(self, num_of_words, to_file, file_name):
         """
         Method responsible for generating a text.
@@ -94,7 +337,7 @@ class Generator:
         # Check for unigrams
         if self._ngram_model.get_n() == 1:
             # Logic for unigram model
-            text = [self._ngram_model[NO_CONTEXT].generate() for _ in range(num_of_words)]
+            text = [self._sample(NO_CONTEXT) for _ in range(num_of_words)]
         else:
             # Logic for n > 1 ngram models
             context = self._incipts.generate()
@@ -105,7 +348,7 @@ class Generator:
             n = self._ngram_model.get_n()
 
             while num_of_words:
-                next_word = self._ngram_model[context].generate()
+                next_word = self._sample(context)
                 text.append(next_word)
                 num_of_words -= 1
 
@@ -137,3 +380,9 @@ class Generator:
         Getter method for the attribute incipts
         """
         return self._incipts
+
+    def get_samplers(self):
+        """
+        Getter method for the cache of samplers
+        """
+        return self._samplers
@@ -0,0 +1,57 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Size-bounded cache which evicts the least recently used entry when full.
+    Number of hits and misses is tracked to be able to tune the size.
+    """
+
+    def __init__(self, max_size):
+        """
+        Class constructor.
+        ...
+
+        Parameters:
+        -----------
+        max_size : int
+            Maximum number of entries kept in the cache.
+        """
+        assert max_size > 0
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key, factory):
+        """
+        Return cached value for the key, or build it by calling factory(key) and cache it.
+        """
+        if key in self._entries:
+            self._hits += 1
+            self._entries.move_to_end(key)
+
+            return self._entries[key]
+
+        self._misses += 1
+        value = factory(key)
+        self._entries[key] = value
+        if len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_hits(self):
+        return self._hits
+
+    def get_misses(self):
+        return self._misses
+
+    def __str__(self):
+        return f"size: {len(self._entries)}/{self._max_size}, hits: {self._hits}, misses: {self._misses}"
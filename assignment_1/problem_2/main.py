@@ -4,21 +4,102 @@ import argparse
 import nltk
 from nltk.corpus import reuters
 
-from ngram import BasicNgram, goodturing_estimator
+from ngram import BasicNgram, ESTIMATORS
+from array_ngram import ArrayNgram
+from ngram_trie import NgramTrie
+from sharded_counting import train_parallel
+from corpus import TextCorpus, SnapshotCorpus, snapshot_exists, write_snapshot
 from generator import Generator
 
 
+# Storage backends of ngram model
+BACKENDS = {"nltk": BasicNgram, "array": ArrayNgram}
+
+
 def main(args):
     # Main thread of the program
     
-    corpus = reuters.words()
-    print("Training ngram model...")
-    ngram = BasicNgram(args.ngram, corpus)
+    if args.load_model:
+        # Array backend memory maps the model file, nltk backend rebuilds distributions from it
+        print("Loading ngram model...")
+        if args.backend == "nltk":
+            ngram = BasicNgram.load(args.load_model, lazy=args.lazy)
+        else:
+            ngram = ArrayNgram.load(args.load_model)
+    else:
+        corpus = load_corpus(args)
+        print("Training ngram model...")
+        estimator = ESTIMATORS[args.estimator]
+        if args.min_counts or args.entropy_threshold is not None or args.memory_budget is not None:
+            ngram = train_pruned(args, corpus, estimator)
+        elif args.backend == "nltk":
+            ngram = BasicNgram(args.ngram, corpus, estimator=estimator, lazy=args.lazy)
+        elif args.workers > 1:
+            ngram = train_parallel(args.ngram, corpus, args.workers, estimator=estimator)
+        elif isinstance(corpus, SnapshotCorpus):
+            # Snapshot is already encoded, so ids are counted straight from the memory mapped file
+            ngram = ArrayNgram.from_ids(args.ngram, corpus.get_vocab(), corpus.get_ids(), estimator=estimator)
+        else:
+            ngram = ArrayNgram(args.ngram, corpus, estimator=estimator)
+
+        if args.save_model:
+            print("Saving ngram model...")
+            ngram.save(args.save_model)
+
     print(f"First 10 contexts: {ngram.contexts()[:10]}")
     print("Generating texts...")
-    generator = Generator(ngram, args.textdir)
+    generator = Generator(ngram, args.textdir, sampler_cache_size=args.sampler_cache)
+
+    if args.batch:
+        generated = generator.generate_batch(args.ntexts, args.nwords, args.tofile, args.filename, args.seed)
+    else:
+        generated = generator.generate(args.ntexts,args.nwords, args.tofile, args.filename)
+    print(f"Text generated: {generated}")
+
+    # With a sampler cache in front of the model, repeated contexts never reach the cache of distributions
+    if generator.get_samplers() is not None:
+        print(f"Cache of samplers: {generator.get_samplers()}")
+    elif args.lazy and args.backend == "nltk":
+        print(f"Cache of distributions: {ngram.get_cache()}")
+
+def uses_text_files(args):
+    # Corpus path which is not the nltk corpora directory points to plain text files
+    return os.path.exists(args.corpath) and not os.path.isfile(os.path.join(args.corpath, "reuters.zip"))
+
+def load_corpus(args):
+    """
+    Returns a stream of words: a tokenized snapshot if it exists, otherwise text files or reuters.
+    If a snapshot path is given and it does not exist yet, it is written first,
+    so later runs skip tokenizing (and the nltk corpus reader) entirely.
+    """
+    if args.snapshot and snapshot_exists(args.snapshot):
+        print("Reading corpus snapshot...")
+        return SnapshotCorpus(args.snapshot)
+
+    corpus = TextCorpus(args.corpath) if uses_text_files(args) else reuters.words()
+    if args.snapshot:
+        print("Writing corpus snapshot...")
+        return write_snapshot(args.snapshot, corpus)
+
+    return corpus
+
+def train_pruned(args, corpus, estimator):
+    """
+    Train models of all orders up to n in a trie, prune it and return the n-gram model
+    which backs off to lower orders for pruned contexts.
+    """
+    trie = NgramTrie(args.ngram, corpus, estimator=estimator)
+    memory_budget = int(args.memory_budget * 2**20) if args.memory_budget is not None else None
+    trie, report = trie.prune(args.min_counts, args.entropy_threshold, memory_budget, tokens=corpus)
+
+    print("Pruning report:")
+    print(f"Removed ngrams per order: {report['removed']}")
+    print(f"Trie nodes: {report['nodes'][0]} -> {report['nodes'][1]}")
+    print(f"Trie MB: {report['bytes'][0] / 2**20:.1f} -> {report['bytes'][1] / 2**20:.1f} (fits budget: {report['fits_budget']})")
+    print(f"Minimum counts per order: {report['min_counts']}")
+    print(f"Perplexity on training corpus: {report['perplexity'][0]:.2f} -> {report['perplexity'][1]:.2f}")
 
-    print(f"Text generated: {generator.generate(args.ntexts,args.nwords, args.tofile, args.filename)}")
+    return trie.view(args.ngram, backoff=True)
 
 
 if __name__ == "__main__":
@@ -29,13 +110,30 @@ if __name__ == "__main__":
     # Parameters parsing
     parser = argparse.ArgumentParser(description="Generating news texts using a ngram model.")
     parser.add_argument("ngram", metavar='n', type=int, help="N for ngram model")
-    parser.add_argument("-corpath", default="default_path", type=str, help="Path to corpora directory")
+    parser.add_argument("-backend", default="nltk", choices=BACKENDS, help="Storage backend of ngram model")
+    parser.add_argument("-corpath", default="default_path", type=str, help="Path to corpora directory, or to a text file/directory of text files to train on")
+    parser.add_argument("-snapshot", default=None, type=str, help="Path prefix of a tokenized corpus snapshot, written if it does not exist")
     parser.add_argument("-textdir", default= "", type=str, help="Path to directory where to write generated text")
     parser.add_argument("-ntexts", default=10, type=int, help="Number of texts to be generated")
     parser.add_argument("-nwords", default=100, type=int, help="Number of words per text to be generated")
     parser.add_argument("-tofile", default=False, type=bool, help="Flag to write texts into a file")
     parser.add_argument("-filename", default="generated_text.txt", type=str, help="Name of a file for generated text")
+    parser.add_argument("-estimator", default="ml", choices=ESTIMATORS, help="Estimator of probability distributions")
+    parser.add_argument("-sampler_cache", default=None, type=int, help="Number of contexts for which alias samplers are kept (0 samples directly, default depends on the model)")
+    parser.add_argument("-lazy", default=False, action='store_true', help="Flag to build distributions only for visited contexts (nltk backend)")
+    parser.add_argument("-min_counts", default=None, type=int, nargs='+', help="Pruning: minimum count of ngrams for every order, starting with unigrams")
+    parser.add_argument("-entropy_threshold", default=None, type=float, help="Pruning: relative entropy threshold for removing contexts")
+    parser.add_argument("-memory_budget", default=None, type=float, help="Pruning: maximum size of the model in MB")
+    parser.add_argument("-workers", default=1, type=int, help="Number of processes for counting ngrams (requires -backend array)")
+    parser.add_argument("-save_model", default=None, type=str, help="Path to a file where to save trained model")
+    parser.add_argument("-load_model", default=None, type=str, help="Path to a saved model to be loaded instead of training (n is then ignored)")
+    parser.add_argument("-batch", default=False, action='store_true', help="Flag to generate all texts in lockstep (requires -backend array)")
+    parser.add_argument("-seed", default=None, type=int, help="Seed for batch generation")
     args = parser.parse_args()
+    if args.workers > 1 and args.backend != "array":
+        parser.error("-workers requires -backend array")
+    if args.workers > 1 and (args.min_counts or args.entropy_threshold is not None or args.memory_budget is not None):
+        parser.error("-workers can not be used with pruning (-min_counts, -entropy_threshold, -memory_budget)")
 
     # To measure runtime
     start_time = time.time()
@@ -45,7 +143,8 @@ if __name__ == "__main__":
     # nltk on my machine downloads corpora to nltk_data directory
     # Here is doc for download interface: https://www.nltk.org/_modules/nltk/downloader.html
     # This check can be omitted, just left nltk.download("reuters")
-    if not os.path.isfile(os.path.join(args.corpath, "reuters.zip")):
+    needs_reuters = not args.load_model and not uses_text_files(args) and not (args.snapshot and snapshot_exists(args.snapshot))
+    if needs_reuters and not os.path.isfile(os.path.join(args.corpath, "reuters.zip")):
         nltk.download("reuters")
     
     main(args)
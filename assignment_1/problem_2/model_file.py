@@ -0,0 +1,102 @@
+import json
+import numpy as np
+
+
+"""
+Binary file format for ngram models.
+
+Layout of a file:
+    magic       - 8 bytes, MAGIC
+    header size - 8 bytes, little endian unsigned integer
+    header      - JSON (utf-8) with model options, vocabulary and
+                  description (dtype, shape, offset) of every array
+    arrays      - raw array data, every array starts at a multiple of ALIGNMENT
+
+Arrays are stored raw, so they can be memory mapped straight from the file.
+"""
+
+MAGIC     = b"NGRAM001"
+ALIGNMENT = 64
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def write_model_file(path, header, arrays):
+    """
+    Write a model file.
+    ...
+
+    Parameters:
+    -----------
+    path : str
+        Path of the file to be created.
+    header : dict
+        JSON serializable model description.
+    arrays : dict
+        Name -> np.ndarray of arrays to be stored.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    # Offsets are relative to the start of data section
+    descriptions = dict()
+    offset = 0
+    for name, array in arrays.items():
+        descriptions[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _aligned(offset + array.nbytes)
+
+    header = json.dumps(dict(header, arrays=descriptions)).encode("utf-8")
+    data_start = _aligned(len(MAGIC) + 8 + len(header))
+
+    with open(path, 'wb') as model_file:
+        model_file.write(MAGIC)
+        model_file.write(len(header).to_bytes(8, "little"))
+        model_file.write(header)
+
+        for name, array in arrays.items():
+            model_file.seek(data_start + descriptions[name]["offset"])
+            model_file.write(array.tobytes())
+
+def read_model_file(path, use_mmap=True):
+    """
+    Read a model file.
+    ...
+
+    Parameters:
+    -----------
+    path : str
+        Path of the model file.
+    use_mmap : bool, optional
+        If True arrays are read-only memory mapped views of the file,
+        otherwise they are read into memory.
+
+    Returns:
+    --------
+    header : dict
+        Model description as it was written.
+    arrays : dict
+        Name -> np.ndarray of stored arrays.
+    """
+    with open(path, 'rb') as model_file:
+        if model_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a ngram model file!")
+
+        header_size = int.from_bytes(model_file.read(8), "little")
+        header = json.loads(model_file.read(header_size).decode("utf-8"))
+
+    data_start = _aligned(len(MAGIC) + 8 + header_size)
+    if use_mmap:
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+    else:
+        data = np.fromfile(path, dtype=np.uint8)
+
+    arrays = dict()
+    for name, description in header.pop("arrays").items():
+        dtype = np.dtype(description["dtype"])
+        shape = tuple(description["shape"])
+        start = data_start + description["offset"]
+        size = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+
+        arrays[name] = data[start:start+size].view(dtype).reshape(shape)
+
+    return header, arrays
@@ -1,6 +1,12 @@
 from nltk.probability import (FreqDist, ConditionalFreqDist, ConditionalProbDist, MLEProbDist, SimpleGoodTuringProbDist)
 from nltk.util import ngrams
 
+from lru import LRUCache
+
+
+# Default number of distributions kept in memory by a lazy model
+LAZY_CACHE_SIZE=10000
+
 
 def ml_estimator(freqdist):
     return MLEProbDist(freqdist)
@@ -8,6 +14,16 @@ def ml_estimator(freqdist):
 def goodturing_estimator(freqdist):
     return SimpleGoodTuringProbDist(freqdist)
 
+# Names under which estimators are stored in model files
+ESTIMATORS = {"ml": ml_estimator, "goodturing": goodturing_estimator}
+
+def estimator_name(estimator):
+    for name, known_estimator in ESTIMATORS.items():
+        if known_estimator is estimator:
+            return name
+
+    raise ValueError(f"Estimator {estimator} can not be stored in a model file!")
+
 class BasicNgram(ConditionalProbDist):
     """
     Define and train an Ngram Model over the corpus represented by the list words. 
@@ -32,8 +48,12 @@ class BasicNgram(ConditionalProbDist):
     
     other parameters are optional and may be omitted. They define whether to add artificial symbols before or after the word list, 
     and whether to use another estimation methods than maximum likelihood.
+
+    If lazy is True, the distribution of a context is built only when it is requested for the first time
+    and kept in a LRU cache of cache_size distributions (see get_cache for hits and misses),
+    so startup does not depend on the number of contexts. That matters for costly estimators like goodturing_estimator.
     """
-    def __init__(self, n, words, start_symbol="<$>", end_symbol="</$>", pad_left=True, pad_right=False, estimator=ml_estimator):
+    def __init__(self, n, words, start_symbol="<$>", end_symbol="</$>", pad_left=True, pad_right=False, estimator=ml_estimator, lazy=False, cache_size=LAZY_CACHE_SIZE):
         assert (n > 0)
         self._n=n
         self._words=words
@@ -42,8 +62,98 @@ class BasicNgram(ConditionalProbDist):
         self._end_symbol=end_symbol
         self._pad_left=pad_left
         self._pad_right=pad_right
+        self._estimator=estimator
         self._train()
-        super().__init__(self._counter, estimator)
+        self._init_prob_dists(lazy, cache_size)
+
+    def _init_prob_dists(self, lazy, cache_size=LAZY_CACHE_SIZE):
+        self._lazy=lazy
+        if not lazy:
+            super().__init__(self._counter, self._estimator)
+            return
+
+        # Same attributes as ConditionalProbDist sets, but no distribution is built up front
+        self._probdist_factory=self._estimator
+        self._factory_args=()
+        self._factory_kw_args={}
+        self._cache=LRUCache(cache_size)
+
+    def _build_prob_dist(self, context):
+        freqdist=self._counter[context] if context in self._counter else FreqDist()
+        return self._estimator(freqdist)
+
+    def __getitem__(self, context):
+        if not self._lazy:
+            return super().__getitem__(context)
+
+        return self._cache.get(context, self._build_prob_dist)
+
+    def __contains__(self, context):
+        if not self._lazy:
+            return super().__contains__(context)
+
+        return context in self._counter
+
+    def __len__(self):
+        if not self._lazy:
+            return super().__len__()
+
+        return len(self._counter)
+
+    def conditions(self):
+        if not self._lazy:
+            return super().conditions()
+
+        return list(self._counter.conditions())
+
+    """
+    Score held-out tokens, returns natural log-probability of every ngram and perplexity.
+    Lookups are vectorized over an integer-encoded copy of the counts (see ArrayNgram.score),
+    which is built on the first call.
+    """
+    def score(self, tokens):
+        if getattr(self, "_arrays", None) is None:
+            from array_ngram import ArrayNgram
+
+            self._arrays=ArrayNgram.from_basic(self)
+
+        return self._arrays.score(tokens)
+
+    """
+    Getter for the cache of distributions of a lazy model, None if the model is not lazy
+    """
+    def get_cache(self):
+        return self._cache if self._lazy else None
+
+    """
+    Save the model into a binary model file (see model_file.py), the same format as ArrayNgram uses
+    """
+    def save(self, path):
+        from array_ngram import ArrayNgram
+
+        ArrayNgram.from_basic(self).save(path)
+
+    """
+    Load a model from a binary model file.
+    Note: unless lazy, distributions are built for every context, use ArrayNgram.load for near-instant loading.
+    """
+    @classmethod
+    def load(cls, path, lazy=False, cache_size=LAZY_CACHE_SIZE):
+        from array_ngram import ArrayNgram
+
+        model=ArrayNgram.load(path)
+        ngram=cls.__new__(cls)
+        ngram._n=model.get_n()
+        ngram._words=None
+        ngram._counter=ConditionalFreqDist()
+        ngram._start_symbol, ngram._end_symbol=model.get_symbols()
+        ngram._pad_left, ngram._pad_right=model.get_padding()
+        ngram._estimator=model.get_estimator()
+        for context in model.contexts():
+            ngram._counter[context].update(model[context].freqdist())
+        ngram._init_prob_dists(lazy, cache_size)
+
+        return ngram
         
         
     def _train(self):       
@@ -74,3 +184,15 @@ class BasicNgram(ConditionalProbDist):
     def get_n(self):
         return self._n
 
+    def get_counter(self):
+        return self._counter
+
+    def get_symbols(self):
+        return self._start_symbol, self._end_symbol
+
+    def get_padding(self):
+        return self._pad_left, self._pad_right
+
+    def get_estimator(self):
+        return self._estimator
+
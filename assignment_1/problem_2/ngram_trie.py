@@ -0,0 +1,301 @@
+import numpy as np
+
+from ngram import ml_estimator
+from array_ngram import ArrayNgram, START_ID, END_ID, KEY_BITS, id_bits, pack_ids
+
+
+class NgramTrie:
+    """
+    Trie of ngrams of all orders from 1 to max_n, trained in a single pass over the words.
+
+    Level k of the trie holds one node for every distinct k-gram, and the node of
+    (w1, ..., wk) is a child of the node of (w1, ..., wk-1) at level k-1.
+    Prefix nodes are therefore shared between orders: the context of a
+    k-gram model is just a node of level k-1.
+    Every level is stored as sorted NumPy arrays:
+        keys    - packed path of a node (see array_ngram.pack_ids)
+        parents - index of the parent node in the previous level
+        counts  - how many times the node occurs as a k-gram in the k-gram model
+    A node can have zero count if it is only a prefix of longer ngrams
+    (e.g. a run of start symbols longer than the k-gram model pads with).
+
+    >>> corpus=['a','b','b','a']
+    >>> trie=NgramTrie(3,corpus)
+    >>> bigram=trie.view(2)
+    >>> bigram.contexts()
+    [('<$>',), ('a',), ('b',)]
+    >>> bigram[('b',)].prob('a')
+    0.5
+
+    Note: max_n * id_bits(vocabulary size) has to fit into 64 bits.
+    """
+
+    def __init__(self, max_n, words, start_symbol="<$>", end_symbol="</$>", pad_left=True, pad_right=False, estimator=ml_estimator):
+        """
+        Class constructor.
+        ...
+
+        Parameters:
+        -----------
+        max_n : int
+            The highest order of ngrams.
+        words : iterable
+            Corpus, every word is read only once.
+        other parameters are the same as for BasicNgram and apply to models of every order.
+        """
+        assert (max_n > 0)
+        self._max_n = max_n
+        self._start_symbol = start_symbol
+        self._end_symbol = end_symbol
+        self._pad_left = pad_left
+        self._pad_right = pad_right
+        self._estimator = estimator
+
+        # Single pass over the words, the rest works on word ids
+        word2id = {start_symbol: START_ID, end_symbol: END_ID}
+        ids = np.fromiter((word2id.setdefault(word, len(word2id)) for word in words), dtype=np.int32)
+        self._vocab = list(word2id)
+        self._word2id = word2id
+        self._bits = id_bits(len(self._vocab))
+        if max_n * self._bits > KEY_BITS:
+            raise ValueError(f"Ngrams of order {max_n} with {len(self._vocab)} words do not fit into {KEY_BITS}-bit keys!")
+
+        left = np.full(max_n - 1 if pad_left else 0, START_ID, dtype=np.int32)
+        right = np.full(max_n - 1 if pad_right else 0, END_ID, dtype=np.int32)
+        self._build(np.concatenate((left, ids, right)))
+
+    def _order_windows(self, sequence, k):
+        """
+        Returns packed k-grams of the k-gram model from the sequence padded for the max_n-gram model.
+        The k-gram model pads with only k-1 symbols, so the extra ones are skipped.
+        """
+        extra = self._max_n - k
+        start = extra if self._pad_left else 0
+        end = len(sequence) - (extra if self._pad_right else 0)
+        if end - start < k:
+            return np.zeros(0, dtype=np.uint64)
+
+        return pack_ids(np.lib.stride_tricks.sliding_window_view(sequence[start:end], k), self._bits)
+
+    def _build(self, sequence):
+        """
+        Build levels top-down, nodes of a level are its k-grams plus prefixes of the next level's nodes.
+        """
+        self._keys = [np.zeros(1, dtype=np.uint64)]
+        self._counts = [np.zeros(1, dtype=np.int64)]
+        self._parents = [np.zeros(1, dtype=np.int64)]
+
+        levels = list()
+        prefixes = np.zeros(0, dtype=np.uint64)
+        for k in range(self._max_n, 0, -1):
+            window_keys, window_counts = np.unique(self._order_windows(sequence, k), return_counts=True)
+            keys = np.union1d(window_keys, prefixes)
+
+            counts = np.zeros(len(keys), dtype=np.int64)
+            counts[np.searchsorted(keys, window_keys)] = window_counts
+            levels.append((keys, counts))
+
+            prefixes = np.unique(keys >> np.uint64(self._bits))
+
+        for keys, counts in reversed(levels):
+            self._parents.append(np.searchsorted(self._keys[-1], keys >> np.uint64(self._bits)))
+            self._keys.append(keys)
+            self._counts.append(counts)
+
+    def view(self, n, backoff=False):
+        """
+        Returns BasicNgram compatible n-gram model (ArrayNgram) for an order 1 <= n <= max_n.
+        Contexts of the model are the nodes of level n-1.
+        If backoff, the model backs off to the view of order n-1 (recursively) for contexts
+        and ngrams it does not have, which is needed for pruned tries.
+        """
+        assert 0 < n <= self._max_n
+
+        model = self._view(n)
+        if backoff and n > 1:
+            model.set_backoff(self.view(n - 1, backoff=True))
+
+        return model
+
+    def _view(self, n):
+        present = self._counts[n] > 0
+        parents = self._parents[n][present]
+        outcomes = (self._keys[n][present] & np.uint64((1 << self._bits) - 1)).astype(np.int32)
+        counts = self._counts[n][present]
+
+        # Nodes are sorted by parent first, so outcomes of a context are contiguous
+        new_context = np.ones(len(parents), dtype=bool)
+        new_context[1:] = parents[1:] != parents[:-1]
+        context_starts = np.flatnonzero(new_context)
+        offsets = np.append(context_starts, len(parents)).astype(np.int64)
+        context_keys = self._keys[n-1][parents[context_starts]]
+
+        return ArrayNgram.from_counts(n, self._vocab, context_keys, offsets, outcomes, counts,
+                                      self._start_symbol, self._end_symbol,
+                                      self._pad_left, self._pad_right, self._estimator)
+
+    ###########################
+    # PRUNING                 #
+    ###########################
+
+    def prune(self, min_counts=None, entropy_threshold=None, memory_budget=None, tokens=None):
+        """
+        Returns a pruned copy of the trie and a report of what was removed.
+        ...
+
+        Parameters:
+        -----------
+        min_counts : list(int), optional
+            Minimum count of an ngram for every order (first element for unigrams), ngrams
+            with lower count are removed from the model of their order.
+        entropy_threshold : float, optional
+            Relative entropy pruning of contexts: a context is removed from the model of order k
+            if P(context) * D(P_k(.|context) || P_k-1(.|shorter context)) is below the threshold,
+            i.e. if backing off to the lower order barely changes the model.
+        memory_budget : int, optional
+            Maximum size of the trie in bytes. The cutoff of the order (2 and higher) with most nodes
+            is doubled until the pruned trie fits, but never so far that an order loses all its ngrams.
+        tokens : list(str), optional
+            Words to compute perplexity of the max_n-gram model (with backoff) before and after pruning.
+
+        Returns:
+        --------
+        pruned : NgramTrie
+            Pruned trie, its views have to be used with backoff=True.
+        report : dict
+            Removed ngrams per order, number of nodes and bytes before/after, used cutoffs
+            and perplexity before/after (if tokens are given).
+        """
+        cutoffs = list(min_counts or [])
+        cutoffs += [0] * (self._max_n - len(cutoffs))
+        pruned = self._prune_counts(cutoffs, entropy_threshold)
+
+        # Double the cutoff of the order with most nodes until the trie fits into the budget.
+        # A cutoff which would remove all ngrams of its order is not used and the order is not raised anymore,
+        # so no order (the highest one included) becomes empty.
+        raisable = set(range(2, self._max_n + 1))
+        while memory_budget is not None and pruned.nbytes() > memory_budget and raisable:
+            order = max(raisable, key=lambda k: pruned.num_of_nodes()[k-1])
+            new_cutoffs = list(cutoffs)
+            new_cutoffs[order-1] = max(new_cutoffs[order-1], 1) * 2
+            candidate = self._prune_counts(new_cutoffs, entropy_threshold)
+
+            if not (candidate._counts[order] > 0).any():
+                raisable.remove(order)
+                continue
+            cutoffs, pruned = new_cutoffs, candidate
+
+        report = {"removed": [int((before > 0).sum() - (after > 0).sum()) for before, after in zip(self._counts[1:], pruned._counts[1:])],
+                  "nodes": (self.num_of_nodes(), pruned.num_of_nodes()),
+                  "bytes": (self.nbytes(), pruned.nbytes()),
+                  "min_counts": cutoffs,
+                  "fits_budget": memory_budget is None or pruned.nbytes() <= memory_budget}
+        if tokens is not None:
+            report["perplexity"] = (self.view(self._max_n, backoff=True).score(tokens)[1],
+                                    pruned.view(self._max_n, backoff=True).score(tokens)[1])
+
+        return pruned, report
+
+    def _prune_counts(self, cutoffs, entropy_threshold):
+        counts = [counts.copy() for counts in self._counts]
+
+        for k in range(1, self._max_n + 1):
+            counts[k][counts[k] < cutoffs[k-1]] = 0
+
+            if entropy_threshold is not None and k > 1:
+                counts[k][self._low_entropy_contexts(k, entropy_threshold)[self._parents[k]]] = 0
+
+        return self._with_counts(counts)
+
+    def _level_probs(self, k):
+        """
+        Returns P_k(w|context) of every node of level k, computed from the unpruned counts.
+        """
+        totals = np.bincount(self._parents[k], weights=self._counts[k], minlength=len(self._keys[k-1]))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self._counts[k] / totals[self._parents[k]]
+
+    def _low_entropy_contexts(self, k, threshold):
+        """
+        Returns boolean mask over nodes of level k-1, True for contexts of the k-gram model
+        whose weighted relative entropy to the backoff distribution is below threshold.
+        """
+        probs = self._level_probs(k)
+
+        # Backoff ngram of (w1, ..., wk) is (w2, ..., wk), a node of level k-1
+        suffixes = self._keys[k] & np.uint64((1 << ((k - 1) * self._bits)) - 1)
+        positions = np.minimum(np.searchsorted(self._keys[k-1], suffixes), len(self._keys[k-1]) - 1)
+        found = self._keys[k-1][positions] == suffixes
+        backoff_probs = np.where(found, self._level_probs(k - 1)[positions], 0.0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            terms = np.where(probs > 0, probs * (np.log(probs) - np.log(backoff_probs)), 0.0)
+        entropies = np.bincount(self._parents[k], weights=terms, minlength=len(self._keys[k-1]))
+
+        context_counts = np.bincount(self._parents[k], weights=self._counts[k], minlength=len(self._keys[k-1]))
+        weights = context_counts / max(context_counts.sum(), 1)
+
+        return (context_counts > 0) & (weights * entropies < threshold)
+
+    def _with_counts(self, counts):
+        """
+        Returns a copy of the trie with new counts, nodes with zero count and without children are dropped.
+        """
+        keep = [None] * (self._max_n + 1)
+        keep[self._max_n] = counts[self._max_n] > 0
+        for k in range(self._max_n - 1, 0, -1):
+            has_child = np.zeros(len(self._keys[k]), dtype=bool)
+            has_child[self._parents[k+1][keep[k+1]]] = True
+            keep[k] = (counts[k] > 0) | has_child
+
+        trie = NgramTrie.__new__(NgramTrie)
+        trie.__dict__.update(self.__dict__)
+        trie._keys = [self._keys[0]]
+        trie._counts = [self._counts[0]]
+        trie._parents = [self._parents[0]]
+
+        new_indices = np.zeros(1, dtype=np.int64)
+        for k in range(1, self._max_n + 1):
+            trie._keys.append(self._keys[k][keep[k]])
+            trie._counts.append(counts[k][keep[k]])
+            trie._parents.append(new_indices[self._parents[k][keep[k]]])
+            new_indices = np.cumsum(keep[k]) - 1
+
+        return trie
+
+    def count(self, ngram):
+        """
+        Returns how many times the ngram (tuple of words) occurs in the model of its order.
+        """
+        if not 0 < len(ngram) <= self._max_n:
+            return 0
+
+        node = 0
+        for k, word in enumerate(ngram, 1):
+            word_id = self._word2id.get(word)
+            if word_id is None:
+                return 0
+
+            # Children of a node are contiguous, so they are found by binary search
+            key = (self._keys[k-1][node] << np.uint64(self._bits)) | np.uint64(word_id)
+            node = np.searchsorted(self._keys[k], key)
+            if node == len(self._keys[k]) or self._keys[k][node] != key:
+                return 0
+
+        return int(self._counts[len(ngram)][node])
+
+    def get_max_n(self):
+        return self._max_n
+
+    def get_vocab(self):
+        return self._vocab
+
+    def num_of_nodes(self):
+        return [len(keys) for keys in self._keys[1:]]
+
+    def nbytes(self):
+        """
+        Memory used by the levels in bytes (vocabulary excluded).
+        """
+        return sum(keys.nbytes + counts.nbytes + parents.nbytes
+                   for keys, counts, parents in zip(self._keys, self._counts, self._parents))
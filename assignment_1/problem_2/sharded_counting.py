@@ -0,0 +1,112 @@
+import numpy as np
+from multiprocessing import Pool
+
+from ngram import ml_estimator
+from array_ngram import ArrayNgram, START_ID, END_ID, id_bits, pack_ids, unpack_keys, count_ngrams, merge_count_tables
+
+
+"""
+Parallel training of array backed ngram models and merging of their counts.
+
+The padded corpus is split into shards of consecutive ngram start positions.
+Every shard carries n-1 extra tokens of the next shard, so every ngram
+is counted by exactly one shard and merged counts equal the serial ones.
+Count tables of shards (or of whole models trained on separate corpora)
+are merged by concatenating and re-reducing them.
+"""
+
+
+def shard_bounds(num_of_tokens, n, num_of_shards):
+    """
+    Returns list of (start, end) token slices, one per shard.
+    Neighbouring slices overlap by n-1 tokens, so ngrams crossing a boundary are not lost.
+    """
+    num_of_ngrams = max(num_of_tokens - n + 1, 0)
+    starts = np.linspace(0, num_of_ngrams, num_of_shards + 1).astype(np.int64)
+
+    return [(int(start), int(end) + n - 1) for start, end in zip(starts[:-1], starts[1:]) if end > start]
+
+def _count_shard(shard):
+    ids, n, bits = shard
+
+    return count_ngrams(ids, n, bits)
+
+def count_ngrams_parallel(ids, n, bits, workers, num_of_shards=None):
+    """
+    Parallel version of array_ngram.count_ngrams.
+    ...
+
+    Parameters:
+    -----------
+    ids : np.ndarray
+        1D array of word ids (already padded).
+    n : int
+        Order of the ngrams.
+    bits : int
+        Number of bits reserved for one word id in packed context keys.
+    workers : int
+        Number of processes in the pool.
+    num_of_shards : int, optional
+        Number of shards, by default 4 per worker for load balance.
+
+    Returns:
+    --------
+    Count table as returned by count_ngrams.
+    """
+    num_of_shards = num_of_shards or 4 * workers
+    shards = [(ids[start:end], n, bits) for start, end in shard_bounds(len(ids), n, num_of_shards)]
+    if not shards:
+        return count_ngrams(ids, n, bits)
+
+    with Pool(workers) as pool:
+        tables = pool.map(_count_shard, shards)
+
+    return merge_count_tables(tables)
+
+def train_parallel(n, words, workers, start_symbol="<$>", end_symbol="</$>", pad_left=True, pad_right=False, estimator=ml_estimator, num_of_shards=None):
+    """
+    Train ArrayNgram with counting done in a pool of processes.
+    Words are encoded into ids in this process, only counting is done in parallel.
+    Parameters are the same as for ArrayNgram, plus workers and num_of_shards (see count_ngrams_parallel).
+    """
+    word2id = {start_symbol: START_ID, end_symbol: END_ID}
+    ids = np.fromiter((word2id.setdefault(word, len(word2id)) for word in words), dtype=np.int32)
+    vocab = list(word2id)
+    bits = id_bits(len(vocab))
+
+    left = np.full(n - 1 if pad_left else 0, START_ID, dtype=np.int32)
+    right = np.full(n - 1 if pad_right else 0, END_ID, dtype=np.int32)
+    table = count_ngrams_parallel(np.concatenate((left, ids, right)), n, bits, workers, num_of_shards)
+
+    return ArrayNgram.from_counts(n, vocab, *table, start_symbol, end_symbol, pad_left, pad_right, estimator)
+
+def merge_models(models):
+    """
+    Merge ArrayNgram models, e.g. trained on separate days, into one model with summed counts.
+    Models may have different vocabularies, word ids of all models are remapped
+    into one vocabulary (in order of the models). Order, symbols, padding and estimator
+    are taken from the first model and have to be the same for all models.
+    """
+    assert len(models) > 0
+    first = models[0]
+    n = first.get_n()
+    for model in models[1:]:
+        if model.get_n() != n or model.get_symbols() != first.get_symbols() or model.get_padding() != first.get_padding():
+            raise ValueError("Only models with the same n, symbols and padding can be merged!")
+
+    # Union of vocabularies, artificial symbols keep their ids because they come first in every model
+    word2id = dict()
+    id_maps = list()
+    for model in models:
+        id_maps.append(np.array([word2id.setdefault(word, len(word2id)) for word in model.get_vocab()], dtype=np.int64))
+    vocab = list(word2id)
+    bits = id_bits(len(vocab))
+
+    tables = list()
+    for model, id_map in zip(models, id_maps):
+        context_keys, offsets, outcomes, counts = model.get_count_table()
+        contexts = id_map[unpack_keys(context_keys, n - 1, model.get_bits())]
+        tables.append((pack_ids(contexts, bits), offsets, id_map[outcomes].astype(np.int32), counts))
+
+    return ArrayNgram.from_counts(n, vocab, *merge_count_tables(tables),
+                                  *first.get_symbols(), *first.get_padding(), first.get_estimator())
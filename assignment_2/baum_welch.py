@@ -0,0 +1,210 @@
+import os
+import time
+import argparse
+import numpy as np
+from multiprocessing import Pool
+from nltk.corpus.reader.conll import ConllCorpusReader
+
+from hmm import HMM, END_TOKEN
+
+
+"""
+Unsupervised training of the HMM tagger with Baum-Welch (EM) algorithm on untagged sentences.
+
+Training starts from a supervised model (trained on de-train.tt) or from a config.
+The vocabulary is extended with words of the untagged sentences, their first emissions are
+the emissions of unknown words of the starting model (1.0, or from the suffix model),
+scaled to the rarest word of a tag.
+In the E-step, shards of sentences are processed by a pool of processes (forward-backward
+in log space, see HMM.expected_counts) and expected counts are summed in this process.
+In the M-step, probabilities are the normalized expected counts, transitions from a state
+without expected transitions are kept. The model is saved after every iteration.
+"""
+
+NUM_OF_ITERATIONS = 10
+
+
+# Model of a worker process of the E-step, every iteration starts a new pool with the current model
+_worker_model = None
+_worker_batch_size = 256
+
+def _init_worker(model, batch_size):
+    global _worker_model, _worker_batch_size
+    _worker_model = model
+    _worker_batch_size = batch_size
+
+def _e_step_shard(sentences):
+    return _worker_model.expected_counts(sentences, _worker_batch_size)
+
+def e_step(model, shards, workers, batch_size=256):
+    """
+    Returns expected counts (see HMM.expected_counts) summed over shards.
+    """
+    if workers > 1:
+        with Pool(workers, initializer=_init_worker, initargs=(model, batch_size)) as pool:
+            results = pool.map(_e_step_shard, shards)
+    else:
+        results = [model.expected_counts(shard, batch_size) for shard in shards]
+
+    initial_counts, transition_counts, emission_counts, log_likelihood, skipped = results[0]
+    for shard_initials, shard_transitions, shard_emissions, shard_likelihood, shard_skipped in results[1:]:
+        initial_counts = initial_counts + shard_initials
+        transition_counts = transition_counts + shard_transitions
+        emission_counts = emission_counts + shard_emissions
+        log_likelihood += shard_likelihood
+        skipped += shard_skipped
+
+    return initial_counts, transition_counts, emission_counts, log_likelihood, skipped
+
+def m_step(model, initial_counts, transition_counts, emission_counts):
+    """
+    Set probabilities of the model to normalized expected counts.
+    """
+    _, old_transitions, _ = model.get_probs()
+
+    initial_probs = initial_counts / initial_counts.sum()
+
+    continues_counts = transition_counts.sum(axis=1, keepdims=True)
+    transition_matrix = np.where(continues_counts > 0, transition_counts / np.maximum(continues_counts, 1e-300), old_transitions)
+
+    # All words are in the vocabulary, so the unknown words column has no counts
+    emission_counts = emission_counts[:, :-1]
+    emissions_sums = emission_counts.sum(axis=1, keepdims=True)
+    emission_matrix = emission_counts / np.maximum(emissions_sums, 1e-300)
+
+    model.set_full_probs(initial_probs, transition_matrix, model.get_vocabulary(), emission_matrix)
+
+def extend_vocabulary(model, sentences):
+    """
+    Add words of sentences to the vocabulary of the model, with emissions of unknown words.
+    Probabilities are normalized, so the starting model is a distribution over sentences
+    and log likelihood can only grow.
+    Emissions of known words keep their trained probabilities, a known word which was not seen
+    with a tag gets zero (not the 1.0 placeholder of the model). A new word gets the unknown words
+    column (1.0 or the suffix model, max 1.0) times the probability of the rarest word of a tag,
+    so new words don't outweigh words seen in training.
+    """
+    vocabulary = model.get_vocabulary()
+    num_of_known = len(vocabulary)
+    known = set(vocabulary)
+    for sentence in sentences:
+        for word in sentence:
+            if word not in known:
+                known.add(word)
+                vocabulary.append(word)
+
+    initial_probs, transition_matrix, _ = model.get_probs()
+    rows, columns, probs = model.get_emission_entries()
+    num_of_states = len(initial_probs)
+
+    emission_matrix = np.zeros((num_of_states, len(vocabulary)), dtype=np.float64)
+    emission_matrix[rows, columns] = probs
+
+    rarest = np.full(num_of_states, np.inf)
+    np.minimum.at(rarest, rows[probs > 0], probs[probs > 0])
+    rarest[np.isinf(rarest)] = 1.0
+    emission_matrix[:, num_of_known:] = model.emission_columns(vocabulary[num_of_known:]) * rarest[:, np.newaxis]
+
+    emissions_sums = emission_matrix.sum(axis=1, keepdims=True)
+    model.set_full_probs(initial_probs / initial_probs.sum(), \
+                         transition_matrix / transition_matrix.sum(axis=1, keepdims=True), \
+                         vocabulary, emission_matrix / np.maximum(emissions_sums, 1e-300))
+
+def baum_welch(model, sentences, iterations=NUM_OF_ITERATIONS, workers=1, num_of_shards=None, \
+               checkpoint_prefix=None, batch_size=256, tolerance=0.0):
+    """
+    Train the model with Baum-Welch algorithm.
+    ...
+
+    Parameters:
+    -----------
+    model : HMM
+        Starting model, its probabilities are replaced
+    sentences : list
+        Untagged sentences (lists of words)
+    iterations : int, optional
+        Maximum number of iterations
+    workers : int, optional
+        Number of processes of the E-step
+    num_of_shards : int, optional
+        Number of shards of sentences, by default 4 per worker for load balance
+    checkpoint_prefix : str, optional
+        The model after iteration i is saved to <checkpoint_prefix><i>.npz
+    batch_size : int, optional
+        Maximum number of sentences of the same length computed at once
+    tolerance : float, optional
+        Training stops when log likelihood improves by less than tolerance
+
+    Returns:
+    --------
+    list
+        Log likelihood of sentences before every iteration (under the model of the previous one)
+    """
+    extend_vocabulary(model, sentences)
+
+    num_of_shards = num_of_shards or 4 * workers
+    shards = [shard for shard in np.array_split(np.arange(len(sentences)), num_of_shards) if len(shard) > 0]
+    shards = [[sentences[index] for index in shard] for shard in shards]
+
+    log_likelihoods = list()
+    for iteration in range(1, iterations + 1):
+        start_time = time.time()
+        initial_counts, transition_counts, emission_counts, log_likelihood, skipped = e_step(model, shards, workers, batch_size)
+        m_step(model, initial_counts, transition_counts, emission_counts)
+
+        print(f"Iteration {iteration}: log likelihood {log_likelihood:.2f}, skipped sentences {skipped}, " \
+              f"{time.time() - start_time:.2f} sec")
+
+        if checkpoint_prefix:
+            model.save_model(f"{checkpoint_prefix}{iteration}.npz")
+
+        log_likelihoods.append(log_likelihood)
+        if len(log_likelihoods) > 1 and log_likelihoods[-1] - log_likelihoods[-2] < tolerance:
+            break
+
+    return log_likelihoods
+
+def read_untagged(path, end_token):
+    # Untagged sentences in the format of de-test.t (one word per line, sentences separated by an empty line)
+    corpus = ConllCorpusReader(os.path.dirname(path) or ".", [os.path.basename(path)], ["words", "pos"])
+    sentences = [list(sent) for sent in corpus.sents()]
+
+    if end_token:
+        for sent in sentences:
+            sent.append(END_TOKEN)
+
+    return sentences
+
+
+if __name__ == "__main__":
+    """
+    Program starts here.
+    """
+
+    parser = argparse.ArgumentParser(description="Unsupervised training of HMM tagger with Baum-Welch algorithm.")
+    parser.add_argument("untagged", type=str, help="Path to a file with untagged sentences (format of de-test.t)")
+    parser.add_argument("-full_emissions", default=False, action='store_true', help="Flag to indicate should entries for not emissioned words by tags be added.")
+    parser.add_argument("-add_one", default=False, action='store_true', help="Flag to indicate add-one smoothing usage.")
+    parser.add_argument("-end_token", default=False, action='store_true', help="Flag to indicate usage of end token. Omit if don't want.")
+    parser.add_argument("-suffix_model", default=False, action='store_true', help="Flag to use suffix model for first emissions of new words.")
+    parser.add_argument("-config_path", default=None, type=str, help="Path to a config (.json or binary .npz) to start from, supervised model is trained if omitted.")
+    parser.add_argument("-data_path", default="./data", type=str, help="Path to the directory with de-train.tt for the supervised model.")
+    parser.add_argument("-iterations", default=NUM_OF_ITERATIONS, type=int, help="Maximum number of iterations.")
+    parser.add_argument("-tolerance", default=0.0, type=float, help="Stop when log likelihood improves by less than tolerance.")
+    parser.add_argument("-workers", default=1, type=int, help="Number of processes of the E-step.")
+    parser.add_argument("-batch_size", default=256, type=int, help="Number of sentences of the same length computed at once.")
+    parser.add_argument("-checkpoint", default="./configs/baum_welch_", type=str, help="Prefix of configs saved after every iteration.")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    print("Program started...")
+
+    model = HMM(args.full_emissions, args.add_one, args.end_token, args.config_path, args.data_path, None)
+    if args.suffix_model:
+        model.build_suffix_model()
+
+    sentences = read_untagged(args.untagged, args.end_token)
+    print(f"Untagged sentences: {len(sentences)}")
+    baum_welch(model, sentences, args.iterations, args.workers, None, args.checkpoint, args.batch_size, args.tolerance)
+
+    print(f"Program ended. Runtime: {time.time() - start_time} sec")
@@ -0,0 +1,185 @@
+import time
+import argparse
+from nltk.corpus.reader.conll import ConllCorpusReader
+
+from hmm import HMM, END_TOKEN
+
+
+"""
+Helper script to measure the tagging speed of the HMM tagger.
+IMPORTANT: It is not used by main.py, only for measuring purpose.
+"""
+
+
+def add_model_args(subparser):
+    subparser.add_argument("-full_emissions", default=False, action='store_true', help="Flag to indicate should entries for not emissioned words by tags be added.")
+    subparser.add_argument("-add_one", default=False, action='store_true', help="Flag to indicate add-one smoothing usage.")
+    subparser.add_argument("-end_token", default=False, action='store_true', help="Flag to indicate usage of end token.")
+    subparser.add_argument("-config_path", default=None, type=str, help="Path to a trained config, the model is trained on the data if omitted.")
+    subparser.add_argument("-data_path", default="./data", type=str, help="Path to the directory with de-train.tt and de-test.t.")
+
+def load_model(args):
+    # Model is read from a config if it is given, otherwise trained on de-train.tt
+    return HMM(args.full_emissions, args.add_one, args.end_token, args.config_path, args.data_path, None)
+
+def load_sents(args):
+    corpus = ConllCorpusReader(args.data_path, ".t", ["words", "pos"])
+    sents = [list(sent) for sent in corpus.sents("de-test.t")]
+
+    if args.end_token:
+        for sent in sents:
+            sent.append(END_TOKEN)
+    if args.repeat > 1:
+        # Longer sentences to see the underflow of the trellis viterbi
+        sents = [sum(sents[i:i+args.repeat], list()) for i in range(0, len(sents), args.repeat)]
+
+    return sents
+
+def decode(decoder, sents):
+    start_time = time.time()
+    tags = [list(decoder(sent)) for sent in sents]
+
+    return tags, time.time() - start_time
+
+def viterbi(args):
+    """
+    Report sentences per second of the trellis and the vectorized viterbi,
+    and on how many sentences their tags differ.
+    """
+    model = load_model(args)
+    sents = load_sents(args)
+
+    def trellis(sent):
+        model.do_viterbi_trellis(sent)
+        return model.get_tags()
+
+    trellis_tags, trellis_time = decode(trellis, sents)
+    vectorized_tags, vectorized_time = decode(model.do_viterbi, sents)
+    differ = sum(old != new for old, new in zip(trellis_tags, vectorized_tags))
+
+    print("sentences\ttrellis sent/s\tvectorized sent/s\tspeedup\tdiffer")
+    print(f"{len(sents)}\t{len(sents) / trellis_time:.0f}\t{len(sents) / vectorized_time:.0f}\t{trellis_time / vectorized_time:.1f}\t{differ}")
+
+def batch(args):
+    """
+    Report sentences per second of sentence by sentence and batched viterbi for several batch sizes.
+    """
+    model = load_model(args)
+    sents = load_sents(args)
+
+    single_tags, single_time = decode(model.do_viterbi, sents)
+    print("batch size\tsent/s\tspeedup\tdiffer")
+    print(f"1\t{len(sents) / single_time:.0f}\t1.0\t0")
+
+    for batch_size in args.batch_sizes:
+        start_time = time.time()
+        batch_tags = model.do_viterbi_batch(sents, batch_size)
+        batch_time = time.time() - start_time
+        differ = sum(single != batched for single, batched in zip(single_tags, batch_tags))
+
+        print(f"{batch_size}\t{len(sents) / batch_time:.0f}\t{single_time / batch_time:.1f}\t{differ}")
+
+def beam(args):
+    """
+    Report sentences per second and how often tags differ from exact viterbi for beam widths and thresholds.
+    """
+    model = load_model(args)
+    sents = load_sents(args)
+
+    exact_time = decode(model.do_viterbi, sents)[1]
+    print(f"Tags: {len(model.get_states())}, exact sent/s: {len(sents) / exact_time:.0f}")
+    print("beam\tsent/s\tspeedup\tdiffer sents %\tdiffer words %")
+
+    beams = [(width, None) for width in args.widths] + [(None, threshold) for threshold in args.thresholds]
+    for width, threshold in beams:
+        model.set_beam(width, threshold)
+        beam_time = decode(model.do_viterbi, sents)[1]
+        num_of_sents, differ_sents, num_of_words, differ_words = model.check_beam(sents)
+
+        name = f"width {width}" if width is not None else f"threshold {threshold}"
+        print(f"{name}\t{len(sents) / beam_time:.0f}\t{exact_time / beam_time:.1f}\t" \
+              f"{100 * differ_sents / num_of_sents:.2f}\t{100 * differ_words / num_of_words:.2f}")
+
+def posteriors(args):
+    """
+    Report sentences per second of forward-backward one by one and batched,
+    and how often posterior decoding agrees with viterbi.
+    """
+    model = load_model(args)
+    sents = load_sents(args)
+
+    start_time = time.time()
+    single = [model.log_likelihood(sent) for sent in sents]
+    single_time = time.time() - start_time
+
+    start_time = time.time()
+    batch_posteriors, batch_likelihoods = model.forward_backward_batch(sents, args.batch_size)
+    batch_time = time.time() - start_time
+
+    viterbi_tags = model.tag_sents(sents, args.batch_size)
+    posterior_tags = [[model.get_states()[state] for state in sent_posteriors.argmax(axis=1)] for sent_posteriors in batch_posteriors]
+    agree = sum(viterbi_tag == posterior_tag for viterbi, posterior in zip(viterbi_tags, posterior_tags) \
+                for viterbi_tag, posterior_tag in zip(viterbi, posterior))
+
+    print("one by one sent/s\tbatched sent/s\tmin log likelihood\tposterior = viterbi %")
+    print(f"{len(sents) / single_time:.0f}\t{len(sents) / batch_time:.0f}\t{min(single):.1f}\t" \
+          f"{100 * agree / sum(len(sent) for sent in sents):.2f}")
+
+class DictsHMM(HMM):
+    """
+    The model trained with dictionaries of counts (the original training).
+    """
+
+    def _train_model(self):
+        self._train_model_dicts()
+
+def train(args):
+    """
+    Report training time with dictionaries of counts and with integer-encoded counts,
+    and if both give the same model.
+    """
+    models = list()
+    print("training\tsec")
+    for name, model_class in (("dicts", DictsHMM), ("counts", HMM)):
+        start_time = time.time()
+        models.append(model_class(args.full_emissions, args.add_one, args.end_token, None, args.data_path, None))
+        print(f"{name}\t{time.time() - start_time:.2f}")
+
+    dicts_model, counts_model = models
+    print(f"Same model: {dicts_model.get_config() == counts_model.get_config()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the HMM tagger.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    viterbi_parser = subparsers.add_parser("viterbi", help="Trellis vs vectorized viterbi speed")
+    add_model_args(viterbi_parser)
+    viterbi_parser.add_argument("-repeat", default=1, type=int, help="Number of consecutive test sentences joined into one.")
+    viterbi_parser.set_defaults(func=viterbi)
+
+    batch_parser = subparsers.add_parser("batch", help="Sentence by sentence vs batched viterbi speed")
+    add_model_args(batch_parser)
+    batch_parser.add_argument("-repeat", default=1, type=int, help="Number of consecutive test sentences joined into one.")
+    batch_parser.add_argument("-batch_sizes", default=[16, 64, 256, 1024], type=int, nargs='+', help="Batch sizes to measure.")
+    batch_parser.set_defaults(func=batch)
+
+    beam_parser = subparsers.add_parser("beam", help="Beam pruned vs exact viterbi")
+    add_model_args(beam_parser)
+    beam_parser.add_argument("-repeat", default=1, type=int, help="Number of consecutive test sentences joined into one.")
+    beam_parser.add_argument("-widths", default=[1, 2, 5, 10, 20], type=int, nargs='*', help="Beam widths to measure.")
+    beam_parser.add_argument("-thresholds", default=[2.0, 5.0, 10.0], type=float, nargs='*', help="Beam thresholds (log probability) to measure.")
+    beam_parser.set_defaults(func=beam)
+
+    posteriors_parser = subparsers.add_parser("posteriors", help="Forward-backward speed")
+    add_model_args(posteriors_parser)
+    posteriors_parser.add_argument("-repeat", default=1, type=int, help="Number of consecutive test sentences joined into one.")
+    posteriors_parser.add_argument("-batch_size", default=256, type=int, help="Number of sentences of the same length computed at once.")
+    posteriors_parser.set_defaults(func=posteriors)
+
+    train_parser = subparsers.add_parser("train", help="Training with dictionaries vs integer-encoded counts")
+    add_model_args(train_parser)
+    train_parser.set_defaults(func=train)
+
+    args = parser.parse_args()
+    args.func(args)
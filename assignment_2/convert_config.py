@@ -0,0 +1,16 @@
+import sys
+
+from hmm import HMM
+
+"""
+Script to convert a config between the json and the binary (.npz) format,
+e.g. python convert_config.py configs/base_reduced.json configs/base_reduced.npz
+The format is chosen by the file extension, so it works in both directions.
+"""
+
+
+if len(sys.argv) != 3:
+    sys.exit("\nUsage: " + sys.argv[0] + " <input config> <output config>\n")
+
+model = HMM(False, False, False, sys.argv[1], None, None)
+model.save_model(sys.argv[2])
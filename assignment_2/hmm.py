@@ -1,8 +1,13 @@
 import json
 from collections import deque
+from itertools import islice
+from multiprocessing import Pool
 import numpy as np
 from nltk.corpus.reader.conll import ConllCorpusReader
 
+from lru import LRUCache
+from suffix_model import SuffixModel, MAX_SUFFIX_LENGTH
+
 
 INITIAL_STATE = "initials"
 STATES        = "states"
@@ -11,6 +16,84 @@ TRANSITIONS   = "transitions"
 EMISSIONS     = "emissions"
 END_TOKEN     = "<END>"
 
+# Number of sentences sent to a worker at once during parallel tagging
+CHUNK_SIZE    = 1000
+# Maximum number of unknown words with cached emission columns of the suffix model
+UNKNOWN_CACHE_SIZE = 100000
+
+# Arrays of binary (.npz) configs, besides transitions
+# String lists are stored as <name> (UTF-8 bytes) and <name>_offsets
+OFFSETS        = "_offsets"
+INITIALS       = "initials"
+VOCABULARY     = "vocabulary"
+EMISSION_ROWS  = "emission_rows"
+EMISSION_COLS  = "emission_cols"
+EMISSION_PROBS = "emission_probs"
+
+
+def rescale(probs):
+    """
+    Returns probabilities multiplied by a power of two, so that the highest one is in [0.5, 1).
+    Multiplying by a power of two is exact, so ratios and ties of probabilities are kept.
+    For 2D array every row (sentence of a batch) is rescaled separately.
+    """
+    highest = probs.max(axis=-1, keepdims=True)
+    exponents = np.where(highest > 0.0, np.frexp(highest)[1], 0)
+
+    return np.ldexp(probs, -exponents)
+
+
+def logsumexp(values, axis):
+    """
+    Returns log of sum of exponentials of values along axis, computed stably
+    (the highest value is subtracted first). Sum of only -inf values is -inf.
+    """
+    highest = values.max(axis=axis, keepdims=True)
+    highest = np.where(np.isfinite(highest), highest, 0.0)
+
+    with np.errstate(divide="ignore"):
+        return np.log(np.exp(values - highest).sum(axis=axis)) + np.squeeze(highest, axis=axis)
+
+def encode_strings(strings):
+    """
+    Returns UTF-8 bytes of all strings joined (uint8 array) and offsets of strings (in characters),
+    a compact replacement of NumPy unicode arrays which pad every string to the longest one.
+    """
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in strings], out=offsets[1:])
+
+    return np.frombuffer("".join(strings).encode("utf-8"), dtype=np.uint8), offsets
+
+def decode_strings(data, offsets):
+    # Decoded at once, strings are then sliced out by character offsets
+    text = data.tobytes().decode("utf-8")
+    offsets = offsets.tolist()
+
+    return [text[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def iter_chunks(items, chunk_size):
+    """
+    Yields lists of (at most) chunk_size consecutive items of an iterable.
+    """
+    iterator = iter(items)
+    chunk = list(islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, chunk_size))
+
+# Model of a worker process of parallel tagging, set once when the worker starts
+_worker_model = None
+_worker_batch_size = 1
+
+def _init_worker(model, batch_size):
+    global _worker_model, _worker_batch_size
+    _worker_model = model
+    _worker_batch_size = batch_size
+
+def _tag_chunk(sents):
+    return _worker_model.tag_sents(sents, _worker_batch_size)
+
 
 class State:
     """
@@ -104,9 +187,10 @@ class HMM:
 
     When a model is setup or trained, it can be tested on a
     single sentence by calling do_viterbi, or on a test set
-    by calling test_model. During testing a trellis object
-    is used to store information about states and paths, while
-    final tags will be stored in tags attribute. 
+    by calling test_model. Viterbi runs over dense log-space
+    matrices built from the probability dictionaries, while
+    final tags will be stored in tags attribute. The original
+    trellis of State objects is kept in do_viterbi_trellis.
     """
 
     def __init__(self, full_emissions, add_one, end_token, \
@@ -145,6 +229,14 @@ class HMM:
         self._trellis = Trellis()
         self._tags = deque()
 
+        # Beam of the viterbi, no pruning by default (see set_beam)
+        self._beam_width = None
+        self._beam_threshold = None
+
+        # Emissions of unknown words, the crude handler by default (see build_suffix_model)
+        self._suffix_model = None
+        self._unknown_columns = None
+
         if self._config_path:
             self._read_config()
         else:
@@ -152,8 +244,12 @@ class HMM:
 
     def _read_config(self):
         """
-        Method to setup the model from a config file (.json file).
+        Method to setup the model from a config file (.json or binary .npz file).
         """
+        if self._config_path.endswith(".npz"):
+            self._read_binary_config()
+            return
+
         assert self._config_path.endswith(".json")
 
         try:
@@ -173,11 +269,189 @@ class HMM:
                 self._initial_state = State(INITIAL_STATE, max_prob=1.0)
         except FileNotFoundError:
             print("Not able to open config file!")
-        
+
+            return
+
+        self._build_matrices()
+
+    def _read_binary_config(self):
+        """
+        Method to setup the model from a binary config written by save_model.
+        Matrices are read as they are, dictionaries are rebuilt from them in the same order
+        as they have in the json config only when they are needed.
+        """
+        try:
+            with np.load(self._config_path) as config:
+                arrays = {name: config[name] for name in config.files}
+        except FileNotFoundError:
+            print("Not able to open config file!")
+
+            return
+
+        self._states = decode_strings(arrays[STATES], arrays[STATES + OFFSETS])
+        self._words = decode_strings(arrays[WORDS], arrays[WORDS + OFFSETS])
+        self._set_matrices(arrays[INITIALS], arrays[TRANSITIONS], \
+                           decode_strings(arrays[VOCABULARY], arrays[VOCABULARY + OFFSETS]), \
+                           arrays[EMISSION_ROWS], arrays[EMISSION_COLS], arrays[EMISSION_PROBS])
+
+        # Dictionaries are built only if they are needed (see _build_dicts)
+        self._transitions = None
+        self._emissions = None
+        self._initial_state = State(INITIAL_STATE, max_prob=1.0)
+
+    def save_model(self, path):
+        """
+        Method to save the model into a config file.
+        ...
+
+        Parameters:
+        -----------
+        path : str
+            Path to the config file, if it ends with .npz the binary config is written:
+            states, words and vocabulary of emitted words as UTF-8 bytes with offsets, dense initial
+            and transition probabilities and emissions as a sparse matrix (rows, columns, probs)
+            in order of the emission dictionaries. Otherwise the json config is written.
+        """
+        if not path.endswith(".npz"):
+            with open(path, 'w') as json_file:
+                json.dump(self.get_config(), json_file, indent=4)
+
+            return
+
+        rows, columns, probs = self._emission_entries
+        arrays = {INITIALS: self._initial_probs, \
+                  TRANSITIONS: self._transition_matrix, \
+                  EMISSION_ROWS: rows, \
+                  EMISSION_COLS: columns, \
+                  EMISSION_PROBS: probs}
+        for name, strings in ((STATES, self._states), (WORDS, self._words), (VOCABULARY, list(self._word_index))):
+            arrays[name], arrays[name + OFFSETS] = encode_strings(strings)
+
+        np.savez(path, **arrays)
 
     def _train_model(self):
         """
         Method to train the model from scratch.
+        Words and tags are interned to integers in one pass over the train set and counted
+        with NumPy, probabilities are computed from count matrices and add-one smoothing is applied
+        to them analytically, so nothing is stored for words not emissioned by a tag.
+        Probabilities (and their order in dictionaries) are the same as of _train_model_dicts.
+        """
+        corpus = ConllCorpusReader(self._data_path, ".tt", ["words", "pos"])
+        word2id = dict()
+        tag2id = dict()
+        word_ids = list()
+        tag_ids = list()
+        lengths = list()
+
+        for sent in corpus.tagged_sents("de-train.tt"):
+            # Append end token if required
+            if self._end_token:
+                sent.append((END_TOKEN, END_TOKEN))
+
+            # Tags are added to the model only by transitions, as in _train_model_dicts,
+            # so a one word sentence can not have a new tag
+            if len(sent) == 1 and sent[0][1] not in tag2id:
+                raise KeyError(sent[0][1])
+
+            lengths.append(len(sent))
+            for word, tag in sent:
+                word_ids.append(word2id.setdefault(word, len(word2id)))
+                tag_ids.append(tag2id.setdefault(tag, len(tag2id)))
+
+        self._states = list(tag2id)
+        num_of_states = len(tag2id)
+        num_of_words = len(word2id)
+        words = np.array(word_ids, dtype=np.int64)
+        tags = np.array(tag_ids, dtype=np.int64)
+        lengths = np.array(lengths, dtype=np.int64)
+        starts = np.cumsum(lengths) - lengths
+
+        # Transitions from the initial state are counted only for sentences with more than one word,
+        # other transitions between neighbours in a sentence
+        initial_counts = np.bincount(tags[starts[lengths > 1]], minlength=num_of_states)
+        follows = np.ones(len(tags), dtype=bool)
+        follows[starts] = False
+        nexts = np.flatnonzero(follows)
+        transition_counts = np.bincount(tags[nexts-1] * num_of_states + tags[nexts], \
+                                        minlength=num_of_states**2).reshape(num_of_states, num_of_states)
+        continues_counts = transition_counts.sum(axis=1, keepdims=True)
+
+        if self._add_one:
+            initial_probs = (initial_counts + 1) / (len(lengths) + num_of_states)
+            transition_matrix = (transition_counts + 1) / (continues_counts + num_of_states)
+        else:
+            if (continues_counts == 0).any():
+                raise ZeroDivisionError("A tag without transitions requires add-one smoothing!")
+            initial_probs = initial_counts / len(lengths)
+            transition_matrix = transition_counts / continues_counts
+
+        emissions_counts = np.bincount(tags, minlength=num_of_states)
+        if self._full_emissions:
+            self._words = list(word2id)
+            self._set_matrices(initial_probs, transition_matrix, self._words, \
+                               *self._full_emission_entries(tags, words, emissions_counts))
+        else:
+            self._words = list()
+            self._set_matrices(initial_probs, transition_matrix, \
+                               *self._sparse_emission_entries(tags, words, emissions_counts, list(word2id)))
+
+        # Dictionaries are built only if they are needed (see _build_dicts)
+        self._transitions = None
+        self._emissions = None
+        self._initial_state = State(INITIAL_STATE, max_prob=1.0)
+
+        if self._save_model_path:
+            self.save_model(self._save_model_path)
+
+    def _full_emission_entries(self, tags, words, emissions_counts):
+        """
+        Returns emission entries of all words for every state (the full emissions table), words in order of words.
+        """
+        num_of_states, num_of_words = len(emissions_counts), len(self._words)
+        counts = np.bincount(tags * num_of_words + words, minlength=num_of_states * num_of_words)
+        counts = counts.reshape(num_of_states, num_of_words)
+
+        if self._add_one:
+            probs = (counts + 1) / (emissions_counts[:, np.newaxis] + num_of_words)
+        else:
+            probs = counts / emissions_counts[:, np.newaxis]
+
+        rows = np.repeat(np.arange(num_of_states, dtype=np.int32), num_of_words)
+        columns = np.tile(np.arange(num_of_words, dtype=np.int32), num_of_states)
+
+        return rows, columns, probs.ravel()
+
+    def _sparse_emission_entries(self, tags, words, emissions_counts, id2word):
+        """
+        Returns vocabulary and emission entries of words seen with a state,
+        in order of their first appearance with the state.
+        """
+        num_of_words = len(id2word)
+        keys, first, counts = np.unique(tags * num_of_words + words, return_index=True, return_counts=True)
+        order = np.lexsort((first, keys // num_of_words))
+        rows, word_ids, counts = keys[order] // num_of_words, keys[order] % num_of_words, counts[order]
+
+        # Add-one smoothing adds number of words to the denominator, but without
+        # full emissions the model does not keep words, so it adds zero
+        if self._add_one:
+            probs = (counts + 1) / emissions_counts[rows]
+        else:
+            probs = counts / emissions_counts[rows]
+
+        # Vocabulary in order of first appearance in the entries
+        unique_ids, first = np.unique(word_ids, return_index=True)
+        vocabulary_ids = unique_ids[np.argsort(first)]
+        columns = np.zeros(num_of_words, dtype=np.int32)
+        columns[vocabulary_ids] = np.arange(len(vocabulary_ids), dtype=np.int32)
+
+        return [id2word[word_id] for word_id in vocabulary_ids.tolist()], rows.astype(np.int32), columns[word_ids], probs
+
+    def _train_model_dicts(self):
+        """
+        Method to train the model from scratch with dictionaries of counts.
+        It is slow with full emissions (every new word is added to every tag),
+        kept to compare _train_model against.
         """
         self._states = list()
         self._words = list()
@@ -227,14 +501,10 @@ class HMM:
         self._calc_probs(sent_count)
 
         self._initial_state = State(INITIAL_STATE, max_prob=1.0)
+        self._build_matrices()
 
         if self._save_model_path:
-            config = {STATES: self._states, \
-                     WORDS: self._words, \
-                     TRANSITIONS: self._transitions, \
-                     EMISSIONS: self._emissions}
-            with open(self._save_model_path, 'w') as json_file:
-                json.dump(config, json_file, indent=4)
+            self.save_model(self._save_model_path)
 
     def _init_config(self, tag):
         """
@@ -334,9 +604,121 @@ class HMM:
                 else:
                     self._emissions[key][emssion] /= emissions_count
 
-    def test_model(self, test_path, save_test_file):
+    def _build_matrices(self):
+        """
+        Method to build matrices for the vectorized viterbi out of probability dictionaries.
+        """
+        word_index = dict()
+        for state in self._states:
+            for word in self._emissions[state]:
+                word_index.setdefault(word, len(word_index))
+
+        initial_probs = np.array([self._transitions[INITIAL_STATE][state] for state in self._states], dtype=np.float64)
+        transition_matrix = np.array([[self._transitions[prev_state][state] for state in self._states] \
+                                      for prev_state in self._states], dtype=np.float64)
+
+        # Emission entries in order of states and of their dictionaries
+        rows = np.repeat(np.arange(len(self._states), dtype=np.int32), [len(self._emissions[state]) for state in self._states])
+        columns = np.fromiter((word_index[word] for state in self._states for word in self._emissions[state]), \
+                              dtype=np.int32, count=len(rows))
+        probs = np.fromiter((prob for state in self._states for prob in self._emissions[state].values()), \
+                            dtype=np.float64, count=len(rows))
+
+        self._set_matrices(initial_probs, transition_matrix, list(word_index), rows, columns, probs)
+
+    def _set_matrices(self, initial_probs, transition_matrix, vocabulary, rows, columns, probs):
+        """
+        Method to set dense matrices for the vectorized viterbi.
+        Rows of transitions are previous states and columns next states, both in order of states.
+        Emissions have a column for every word of the vocabulary (emissioned by any state),
+        plus the last column for unknown words. A word which is not in the emissions of a state
+        is emissioned with probability 1.0, the same as the crude unknown words handler of the trellis viterbi.
+        ...
+
+        Parameters:
+        -----------
+        initial_probs : np.ndarray
+            Transition probabilities from the initial state
+        transition_matrix : np.ndarray
+            Transition probabilities between states
+        vocabulary : list
+            Words emissioned by states, in order of first appearance in the emission dictionaries
+        rows, columns, probs : np.ndarray
+            Emission entries (state index, word index, probability), sorted by state
+            and in order of the emission dictionaries
+        """
+        self._initial_probs = initial_probs
+        self._transition_matrix = transition_matrix
+        self._word_index = {word: index for index, word in enumerate(vocabulary)}
+        self._emission_entries = (rows, columns, probs)
+
+        self._emission_matrix = np.ones((len(self._states), len(vocabulary) + 1), dtype=np.float64)
+        self._emission_matrix[rows, columns] = probs
+
+        # Log probabilities for forward-backward, zero probabilities become -inf
+        with np.errstate(divide="ignore"):
+            self._log_initial_probs = np.log(initial_probs)
+            self._log_transition_matrix = np.log(transition_matrix)
+
+    def _build_dicts(self):
+        """
+        Method to build probability dictionaries out of matrices, if the model does not have them yet.
+        Their order is the same as of dictionaries of a trained model.
+        """
+        if self._transitions is not None:
+            return
+
+        self._transitions = {INITIAL_STATE: dict(zip(self._states, self._initial_probs.tolist()))}
+        for state, row in zip(self._states, self._transition_matrix.tolist()):
+            self._transitions[state] = dict(zip(self._states, row))
+
+        rows, columns, probs = self._emission_entries
+        vocabulary = list(self._word_index)
+        bounds = np.searchsorted(rows, np.arange(len(self._states) + 1)).tolist()
+        columns, probs = columns.tolist(), probs.tolist()
+
+        self._emissions = dict()
+        for index, state in enumerate(self._states):
+            start, end = bounds[index], bounds[index+1]
+            self._emissions[state] = dict(zip([vocabulary[column] for column in columns[start:end]], probs[start:end]))
+
+    def encode_words(self, sentence):
+        """
+        Returns array of emission columns of words, unknown words get the last column.
+        """
+        unknown = len(self._word_index)
+
+        return np.fromiter((self._word_index.get(word, unknown) for word in sentence), dtype=np.int64, count=len(sentence))
+
+    def build_suffix_model(self, max_length=MAX_SUFFIX_LENGTH, cache_size=UNKNOWN_CACHE_SIZE):
+        """
+        Method to build the suffix model of unknown words (see SuffixModel) out of emissions.
+        Then unknown words are emissioned with probabilities from the suffix model instead of 1.0,
+        their columns are computed once per word and kept in a bounded cache.
+        """
+        self._suffix_model = SuffixModel(list(self._word_index), *self._emission_entries, \
+                                         self._initial_probs, self._transition_matrix, max_length)
+        self._unknown_columns = LRUCache(cache_size)
+
+    def emission_columns(self, words):
+        """
+        Returns (tags x words) matrix of emission probabilities of words.
+        Columns of known words are taken from the emission matrix (one per word type),
+        of unknown words from the suffix model if it is built.
+        """
+        word_ids = self.encode_words(words)
+        columns = self._emission_matrix[:, word_ids]
+
+        if self._suffix_model is not None:
+            for position in np.flatnonzero(word_ids == len(self._word_index)).tolist():
+                columns[:, position] = self._unknown_columns.get(words[position], self._suffix_model.column)
+
+        return columns
+
+    def test_model(self, test_path, save_test_file, batch_size=1, workers=1):
         """
         Wrapper method around do_viterbi method to enable testing with more sentences.
+        Sentences are read, tagged and written in chunks, so memory does not grow with the test set.
         ...
 
         Parameters:
@@ -344,41 +726,499 @@ class HMM:
             Directory where to find test set
         save_test_file : str
             File path to store output, words with corresponding predicted tags
+        batch_size : int, optional
+            Number of sentences of the same length decoded at once by do_viterbi_batch,
+            1 to decode sentence by sentence with do_viterbi
+        workers : int, optional
+            Number of processes tagging chunks in parallel, 1 to tag in this process
+        """
+        try:
+            conll_file = open(save_test_file, 'w')
+        except FileNotFoundError:
+            print("Not able to open the file for test writing!")
+
+            return False
+
+        with conll_file:
+            chunks = iter_chunks(self.read_test_sents(test_path), CHUNK_SIZE)
+            for chunk, tags in self.tag_chunks(chunks, batch_size, workers):
+                for sent, sent_tags in zip(chunk, tags):
+                    for pair in zip(sent, sent_tags):
+                        conll_file.write("\t".join(pair)+'\n')
+                    conll_file.write('\n')
+        
+        return True
+
+    def read_test_sents(self, test_path):
+        """
+        Generator of sentences of the test set (de-test.t in test_path).
         """
         corpus = ConllCorpusReader(test_path, ".t", ["words", "pos"])
-        result = list()
 
         for sent in corpus.sents("de-test.t"):
             # Append end token if required
             if self._end_token:
                 sent.append(END_TOKEN)
 
-            self.do_viterbi(sent)
-            result.append(list(zip(sent, self._tags)))
+            yield sent
 
-        try:
-            with open(save_test_file, 'w') as conll_file:
-                for sent in result:
-                    for pair in sent:
-                        conll_file.write("\t".join(pair)+'\n')
-                    conll_file.write('\n')
-        except FileNotFoundError:
-            print("Not able to open the file for test writing!")
+    def tag_sents(self, sents, batch_size=1):
+        """
+        Returns predicted tags of sentences, decoded in batches if batch_size > 1
+        (with a beam they are always decoded one by one).
+        """
+        if batch_size > 1 and self._beam_width is None and self._beam_threshold is None:
+            return self.do_viterbi_batch(sents, batch_size)
 
-            return False
-        
-        return True
+        return [self.do_viterbi(sent) for sent in sents]
+
+    def tag_chunks(self, chunks, batch_size=1, workers=1):
+        """
+        Generator of (chunk, tags of its sentences) in order of chunks.
+        ...
+
+        With more workers, chunks are tagged in a pool of processes which get the model once,
+        when they start (shared by fork). At most two chunks per worker are in flight,
+        so chunks are read only as fast as they are tagged, and tags are yielded
+        as soon as the oldest chunk is done.
+
+        Parameters:
+        -----------
+        chunks : iterable
+            Lists of sentences
+        batch_size : int, optional
+            See tag_sents
+        workers : int, optional
+            Number of processes, 1 to tag in this process
+        """
+        if workers <= 1:
+            for chunk in chunks:
+                yield chunk, self.tag_sents(chunk, batch_size)
+            return
+
+        with Pool(workers, initializer=_init_worker, initargs=(self, batch_size)) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append((chunk, pool.apply_async(_tag_chunk, (chunk,))))
+
+                if len(pending) >= 2 * workers:
+                    chunk, result = pending.popleft()
+                    yield chunk, result.get()
+
+            while pending:
+                chunk, result = pending.popleft()
+                yield chunk, result.get()
 
     def do_viterbi(self, sentence):
         """
-        Method for performing viterbi algorithm on a sentence
+        Method for performing vectorized viterbi algorithm on a sentence.
+        All states of a timestep are computed at once from the matrices,
+        and backpointers are indices of states in an integer array.
         ...
 
+        Probabilities of a timestep are rescaled by a power of two, so they
+        do not underflow on long sentences. Scaling by a power of two is exact,
+        so every comparison (and tie, which are common because of the unknown
+        words handler) is the same as in do_viterbi_trellis, unlike sums of logs.
+        Ties are broken towards the first state, as in do_viterbi_trellis.
+
         Parameters:
         -----------
         sentence : list
             List of words
+
+        Returns:
+        --------
+        list
+            Predicted tags (also stored in tags attribute)
+        """
+        self._tags.clear()
+        if len(sentence) == 0:
+            return list()
+
+        emissions = self.emission_columns(sentence)
+        backpointers = np.zeros((len(sentence), len(self._states)), dtype=np.int64)
+        states = np.arange(len(self._states))
+
+        scores = self._initial_probs * emissions[:, 0]
+        for timestep in range(1, len(sentence)):
+            scores = rescale(scores)
+            beam = self._beam(scores)
+
+            # Same order of multiplications as in do_viterbi_trellis, emission is part of every
+            # candidate, so a state that cannot emit the word gets the first previous state as backpointer
+            if beam is None:
+                candidates = scores[:, np.newaxis] * self._transition_matrix * emissions[:, timestep]
+                backpointers[timestep] = candidates.argmax(axis=0)
+                scores = candidates[backpointers[timestep], states]
+            else:
+                # Only states in the beam (in order of states) are extended
+                candidates = scores[beam, np.newaxis] * self._transition_matrix[beam] * emissions[:, timestep]
+                best = candidates.argmax(axis=0)
+                backpointers[timestep] = beam[best]
+                scores = candidates[best, states]
+
+        path = np.zeros(len(sentence), dtype=np.int64)
+        path[-1] = scores.argmax()
+        for timestep in range(len(sentence) - 1, 0, -1):
+            path[timestep-1] = backpointers[timestep, path[timestep]]
+
+        self._tags.extend(self._states[state] for state in path)
+
+        return list(self._tags)
+
+    def set_beam(self, width=None, threshold=None):
+        """
+        Method to set beam pruning of do_viterbi, by default (both None) it is exact.
+        ...
+
+        Parameters:
+        -----------
+        width : int, optional
+            Maximum number of states of a timestep extended to the next timestep
+        threshold : float, optional
+            Only states with log probability at least the highest one minus threshold are extended
+        """
+        assert width is None or width > 0
+        assert threshold is None or threshold >= 0
+
+        self._beam_width = width
+        self._beam_threshold = threshold
+
+    def _beam(self, scores):
         """
+        Returns sorted indices of states in the beam, or None if all states are extended.
+        """
+        if self._beam_width is None and self._beam_threshold is None:
+            return None
+
+        highest = scores.max()
+        if highest <= 0.0:
+            return None
+
+        keep = np.ones(len(scores), dtype=bool)
+        if self._beam_threshold is not None:
+            keep &= scores >= highest * np.exp(-self._beam_threshold)
+        if self._beam_width is not None and keep.sum() > self._beam_width:
+            top = np.argpartition(-np.where(keep, scores, -1.0), self._beam_width - 1)[:self._beam_width]
+            keep[:] = False
+            keep[top] = True
+
+        return np.flatnonzero(keep)
+
+    def check_beam(self, sents):
+        """
+        Returns how often beam pruned paths differ from exact ones: (number of sentences,
+        sentences with different tags, number of words, words with different tags).
+        """
+        width, threshold = self._beam_width, self._beam_threshold
+        self.set_beam()
+        exact_tags = [self.do_viterbi(sent) for sent in sents]
+        self.set_beam(width, threshold)
+        beam_tags = [self.do_viterbi(sent) for sent in sents]
+
+        differ_sents = sum(exact != beam for exact, beam in zip(exact_tags, beam_tags))
+        differ_words = sum(exact_tag != beam_tag for exact, beam in zip(exact_tags, beam_tags) \
+                           for exact_tag, beam_tag in zip(exact, beam))
+
+        return len(sents), differ_sents, sum(len(sent) for sent in sents), differ_words
+
+    def do_viterbi_batch(self, sentences, batch_size=256):
+        """
+        Method for performing viterbi algorithm on many sentences at once.
+        Sentences are grouped by length, so a batch needs no padding, and every batch is decoded
+        over (batch x tags x tags) arrays in one pass. Tags are the same as of do_viterbi.
+        ...
+
+        Parameters:
+        -----------
+        sentences : list
+            List of sentences (lists of words)
+        batch_size : int, optional
+            Maximum number of sentences decoded at once
+
+        Returns:
+        --------
+        list
+            Predicted tags of every sentence, in order of sentences
+        """
+        result = [list() for _ in sentences]
+
+        buckets = dict()
+        for index, sentence in enumerate(sentences):
+            buckets.setdefault(len(sentence), list()).append(index)
+
+        for length, indices in buckets.items():
+            if length == 0:
+                continue
+
+            for start in range(0, len(indices), batch_size):
+                batch = indices[start:start+batch_size]
+                paths = self._viterbi_paths([sentences[index] for index in batch])
+
+                for index, path in zip(batch, paths):
+                    result[index] = [self._states[state] for state in path]
+
+        return result
+
+    def _viterbi_paths(self, sentences):
+        """
+        Returns (batch x time) array of state indices of the best paths of sentences of the same length.
+        """
+        num_of_sents, length = len(sentences), len(sentences[0])
+
+        # (batch x tags x time)
+        emissions = self.emission_columns([word for sentence in sentences for word in sentence])
+        emissions = emissions.reshape(len(self._states), num_of_sents, length).transpose(1, 0, 2)
+        backpointers = np.zeros((num_of_sents, length, len(self._states)), dtype=np.int64)
+        sents = np.arange(num_of_sents)[:, np.newaxis]
+        states = np.arange(len(self._states))
+
+        scores = self._initial_probs * emissions[:, :, 0]
+        for timestep in range(1, length):
+            scores = rescale(scores)
+
+            # (batch x previous state x state), multiplied in the same order as in do_viterbi
+            candidates = scores[:, :, np.newaxis] * self._transition_matrix * emissions[:, np.newaxis, :, timestep]
+            backpointers[:, timestep] = candidates.argmax(axis=1)
+            scores = candidates[sents, backpointers[:, timestep], states]
+
+        paths = np.zeros((num_of_sents, length), dtype=np.int64)
+        paths[:, -1] = scores.argmax(axis=1)
+        for timestep in range(length - 1, 0, -1):
+            paths[:, timestep-1] = backpointers[sents[:, 0], timestep, paths[:, timestep]]
+
+        return paths
+
+    ############################
+    # FORWARD-BACKWARD         #
+    ############################
+
+    def forward(self, sentence):
+        """
+        Returns (time x tags) array of log forward probabilities,
+        log P(words up to t, tag at t is s).
+        """
+        return self._forward_backward([sentence])[0][0]
+
+    def backward(self, sentence):
+        """
+        Returns (time x tags) array of log backward probabilities,
+        log P(words after t | tag at t is s).
+        """
+        return self._forward_backward([sentence])[1][0]
+
+    def posteriors(self, sentence):
+        """
+        Returns (time x tags) array of posterior probabilities of tags, P(tag at t is s | words).
+        """
+        return self.forward_backward_batch([sentence])[0][0]
+
+    def log_likelihood(self, sentence):
+        """
+        Returns log probability of the sentence, summed over all paths.
+        Note that without full emissions (and for unknown words without the suffix model) the model
+        emits words not seen with a tag with probability 1.0, so it is not a proper distribution over sentences.
+        """
+        return self.forward_backward_batch([sentence])[1][0]
+
+    def do_posterior_decoding(self, sentence):
+        """
+        Returns tags with the highest posterior probability for every word.
+        """
+        return [self._states[state] for state in self.posteriors(sentence).argmax(axis=1)]
+
+    def forward_backward_batch(self, sentences, batch_size=256):
+        """
+        Method for performing forward-backward algorithm on many sentences at once.
+        Sentences are grouped by length (as in do_viterbi_batch), and every batch is computed over
+        (batch x time x tags) arrays in log space with log-sum-exp, so long sentences do not underflow.
+        ...
+
+        Parameters:
+        -----------
+        sentences : list
+            List of sentences (lists of words)
+        batch_size : int, optional
+            Maximum number of sentences computed at once
+
+        Returns:
+        --------
+        posteriors : list
+            (time x tags) array of posterior probabilities of tags for every sentence
+        log_likelihoods : np.ndarray
+            Log probability of every sentence
+        """
+        posteriors = [np.zeros((0, len(self._states)), dtype=np.float64) for _ in sentences]
+        log_likelihoods = np.zeros(len(sentences), dtype=np.float64)
+
+        buckets = dict()
+        for index, sentence in enumerate(sentences):
+            buckets.setdefault(len(sentence), list()).append(index)
+
+        for length, indices in buckets.items():
+            if length == 0:
+                continue
+
+            for start in range(0, len(indices), batch_size):
+                batch = indices[start:start+batch_size]
+                log_forward, log_backward, _ = self._forward_backward([sentences[index] for index in batch])
+                batch_likelihoods = logsumexp(log_forward[:, -1], axis=1)
+
+                # Impossible sentences have no posteriors, they are left zero
+                with np.errstate(invalid="ignore"):
+                    batch_posteriors = np.exp(log_forward + log_backward - batch_likelihoods[:, np.newaxis, np.newaxis])
+                batch_posteriors[~np.isfinite(batch_likelihoods)] = 0.0
+
+                for position, index in enumerate(batch):
+                    posteriors[index] = batch_posteriors[position]
+                    log_likelihoods[index] = batch_likelihoods[position]
+
+        return posteriors, log_likelihoods
+
+    def _forward_backward(self, sentences):
+        """
+        Returns (batch x time x tags) arrays of log forward probabilities, log backward probabilities
+        and log emission probabilities of sentences of the same length.
+        Empty sentences give empty (batch x 0 x tags) arrays.
+        """
+        num_of_sents, length = len(sentences), len(sentences[0])
+        if length == 0:
+            empty = np.zeros((num_of_sents, 0, len(self._states)), dtype=np.float64)
+
+            return empty, empty.copy(), empty.copy()
+
+        with np.errstate(divide="ignore"):
+            log_emissions = np.log(self.emission_columns([word for sentence in sentences for word in sentence]))
+        log_emissions = log_emissions.reshape(len(self._states), num_of_sents, length).transpose(1, 2, 0)
+
+        log_forward = np.zeros((num_of_sents, length, len(self._states)), dtype=np.float64)
+        log_forward[:, 0] = self._log_initial_probs + log_emissions[:, 0]
+        for timestep in range(1, length):
+            # (batch x previous state x state), summed over previous states
+            log_forward[:, timestep] = logsumexp(log_forward[:, timestep-1, :, np.newaxis] + self._log_transition_matrix, axis=1) \
+                                       + log_emissions[:, timestep]
+
+        log_backward = np.zeros((num_of_sents, length, len(self._states)), dtype=np.float64)
+        for timestep in range(length - 2, -1, -1):
+            # (batch x state x next state), summed over next states
+            log_backward[:, timestep] = logsumexp(self._log_transition_matrix \
+                                                  + (log_emissions[:, timestep+1] + log_backward[:, timestep+1])[:, np.newaxis, :], axis=2)
+
+        return log_forward, log_backward, log_emissions
+
+    def expected_counts(self, sentences, batch_size=256):
+        """
+        Method to compute expected counts of the E-step of Baum-Welch algorithm on sentences.
+        Sentences which are impossible under the model are skipped.
+        ...
+
+        Parameters:
+        -----------
+        sentences : list
+            List of sentences (lists of words), words should be in the vocabulary of the model
+        batch_size : int, optional
+            Maximum number of sentences of the same length computed at once
+
+        Returns:
+        --------
+        initial_counts : np.ndarray
+            Expected number of sentences starting with every state
+        transition_counts : np.ndarray
+            (tags x tags) expected number of transitions
+        emission_counts : np.ndarray
+            (tags x words) expected number of emissions of every word of the vocabulary (plus the unknown column)
+        log_likelihood : float
+            Sum of log probabilities of (possible) sentences
+        skipped : int
+            Number of impossible sentences
+        """
+        num_of_states = len(self._states)
+        initial_counts = np.zeros(num_of_states, dtype=np.float64)
+        transition_counts = np.zeros((num_of_states, num_of_states), dtype=np.float64)
+        emission_counts = np.zeros((len(self._word_index) + 1, num_of_states), dtype=np.float64)
+        log_likelihood = 0.0
+        skipped = 0
+
+        buckets = dict()
+        for sentence in sentences:
+            if len(sentence) > 0:
+                buckets.setdefault(len(sentence), list()).append(sentence)
+
+        for bucket in buckets.values():
+            for start in range(0, len(bucket), batch_size):
+                batch = bucket[start:start+batch_size]
+                log_forward, log_backward, log_emissions = self._forward_backward(batch)
+                likelihoods = logsumexp(log_forward[:, -1], axis=1)
+
+                possible = np.isfinite(likelihoods)
+                skipped += int((~possible).sum())
+                log_likelihood += float(likelihoods[possible].sum())
+                if not possible.any():
+                    continue
+
+                log_forward, log_backward, log_emissions = log_forward[possible], log_backward[possible], log_emissions[possible]
+                likelihoods = likelihoods[possible, np.newaxis, np.newaxis]
+
+                posteriors = np.exp(log_forward + log_backward - likelihoods)
+                initial_counts += posteriors[:, 0].sum(axis=0)
+
+                word_ids = np.array([self.encode_words(sentence) for sentence, keep in zip(batch, possible) if keep], dtype=np.int64).reshape(-1)
+                np.add.at(emission_counts, word_ids, posteriors.reshape(-1, num_of_states))
+
+                # Expected transitions between timesteps t and t+1, (batch x state x next state)
+                for timestep in range(log_forward.shape[1] - 1):
+                    transition_counts += np.exp(log_forward[:, timestep, :, np.newaxis] + self._log_transition_matrix \
+                                                + (log_emissions[:, timestep+1] + log_backward[:, timestep+1])[:, np.newaxis, :] \
+                                                - likelihoods).sum(axis=0)
+
+        return initial_counts, transition_counts, emission_counts.T, log_likelihood, skipped
+
+    def set_full_probs(self, initial_probs, transition_matrix, vocabulary, emission_matrix):
+        """
+        Method to replace probabilities of the model, e.g. after the M-step of Baum-Welch algorithm.
+        Emissions are the full table (tags x vocabulary), the suffix model is dropped,
+        because it was built from the old emissions.
+        """
+        self._words = list(vocabulary)
+        self._full_emissions = True
+
+        rows = np.repeat(np.arange(len(self._states), dtype=np.int32), len(vocabulary))
+        columns = np.tile(np.arange(len(vocabulary), dtype=np.int32), len(self._states))
+        self._set_matrices(initial_probs, transition_matrix, self._words, rows, columns, emission_matrix.ravel())
+
+        self._transitions = None
+        self._emissions = None
+        self._suffix_model = None
+        self._unknown_columns = None
+
+    def get_vocabulary(self):
+        return list(self._word_index)
+
+    def get_emission_entries(self):
+        # Emissions seen in training as (state index, word index, probability)
+        return self._emission_entries
+
+    def get_probs(self):
+        """
+        Returns initial probabilities, transition matrix and emission matrix (with the unknown words column).
+        """
+        return self._initial_probs, self._transition_matrix, self._emission_matrix
+
+    def do_viterbi_trellis(self, sentence):
+        """
+        Method for performing viterbi algorithm on a sentence with the trellis of State objects.
+        It multiplies raw probabilities, so it underflows on long sentences,
+        kept to compare do_viterbi against.
+        ...
+
+        Parameters:
+        -----------
+        sentence : list
+            List of words
+        """
+        self._build_dicts()
+
         # Need to clear trellis from the previous sentence during
         # whole test set processing
         self._trellis.clear_model()
@@ -441,6 +1281,23 @@ class HMM:
                     curr_state = state
                     break
     
+    def get_config(self):
+        """
+        Returns the model as the json config (dictionary).
+        """
+        self._build_dicts()
+
+        return {STATES: self._states, \
+                WORDS: self._words, \
+                TRANSITIONS: self._transitions, \
+                EMISSIONS: self._emissions}
+
+    def get_tags(self):
+        return list(self._tags)
+
+    def get_states(self):
+        return self._states
+
     ############################
     # HELPER METHODS FOR CHECK #
     ############################
@@ -449,6 +1306,7 @@ class HMM:
         print(f"Predicted tags: {' '.join(self._tags)}")
 
     def print_model(self):
+        self._build_dicts()
         print("----- Model summary -----")
         print(f"Number of states: {len(self._states)}\nStates: {self._states}")
         print()
@@ -463,6 +1321,7 @@ class HMM:
             print(f"{key}: {value}")
 
     def check_total_probs(self):
+        self._build_dicts()
         print("Transitions:")
         for key, value in self._transitions.items():
             print(f"{key}: {sum(value.values())}")
@@ -13,7 +13,14 @@ def main(args):
                 args.data_path, \
                 args.save_model)
 
-    model.test_model(args.data_path, args.save_test)
+    if args.suffix_model:
+        model.build_suffix_model()
+    model.set_beam(args.beam_width, args.beam_threshold)
+    model.test_model(args.data_path, args.save_test, args.batch_size, args.workers)
+
+    if args.beam_check:
+        sents, differ_sents, words, differ_words = model.check_beam(list(model.read_test_sents(args.data_path)))
+        print(f"Beam differs from exact viterbi in {differ_sents}/{sents} sentences, {differ_words}/{words} words")
 
 if __name__ == "__main__":
     """
@@ -25,9 +32,15 @@ if __name__ == "__main__":
     parser.add_argument("-full_emissions", default=False, action='store_true', help="Flag to indicate should entries for not emissioned words by tags be added.")
     parser.add_argument("-add_one", default=False, action='store_true', help="Flag to indicate add-one smoothing usage.")
     parser.add_argument("-end_token", default=False, action='store_true', help="Flag to indicate usage of end token. Omit if don't want.")
-    parser.add_argument("-config_path", default=None, type=str, help="Path to the directory where to store trained configs.")
+    parser.add_argument("-suffix_model", default=False, action='store_true', help="Flag to use suffix model for unknown words instead of emission 1.0.")
+    parser.add_argument("-config_path", default=None, type=str, help="Path to a trained config (.json or binary .npz) to use instead of training.")
     parser.add_argument("-data_path", default="./data", type=str, help="Path to the directory where the data for training/testing/eval are.")
-    parser.add_argument("-save_model", default="./configs/config.json", type=str, help="Path to a file where to save trained config.")
+    parser.add_argument("-save_model", default="./configs/config.json", type=str, help="Path to a file where to save trained config, binary format if it ends with .npz.")
+    parser.add_argument("-batch_size", default=256, type=int, help="Number of sentences of the same length tagged at once, 1 to tag sentence by sentence.")
+    parser.add_argument("-workers", default=1, type=int, help="Number of processes for tagging.")
+    parser.add_argument("-beam_width", default=None, type=int, help="Maximum number of states extended at every timestep of viterbi.")
+    parser.add_argument("-beam_threshold", default=None, type=float, help="Extend only states with log probability at least the highest one minus threshold.")
+    parser.add_argument("-beam_check", default=False, action='store_true', help="Flag to report how often beam pruned tags differ from exact viterbi.")
     parser.add_argument("-save_test", default="./outputs/test.tt", type=str, help="Path to a file for test output.")
     args = parser.parse_args()
 
@@ -0,0 +1,161 @@
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+import socketserver
+import numpy as np
+from collections import deque
+
+from hmm import HMM, END_TOKEN
+from lru import LRUCache
+
+
+"""
+Long-running tagging service, the model is loaded (or trained) once and stays in memory.
+One request is one line with a tokenized sentence (tokens separated by whitespace),
+the response is one line with tags separated by spaces.
+Requests are read from stdin (responses written to stdout), or from clients
+of a Unix socket if -socket is given. Tags of repeated sentences come from an LRU cache.
+Latency percentiles and cache hit rate are written to stderr.
+"""
+
+CACHE_SIZE     = 100000
+# Latency percentiles are computed over this many last requests
+LATENCY_WINDOW = 100000
+
+
+class TaggingService:
+    """
+    Tagger with memoized results and latency statistics.
+    """
+
+    def __init__(self, model, end_token=False, cache_size=CACHE_SIZE):
+        """
+        Class constructor.
+        ...
+
+        Parameters:
+        -----------
+        model : HMM
+            Trained model.
+        end_token : bool, optional
+            Flag to append <END> token to every sentence (for models trained with it),
+            its tag is not returned.
+        cache_size : int, optional
+            Maximum number of sentences with cached tags.
+        """
+        self._model = model
+        self._end_token = end_token
+        self._cache = LRUCache(cache_size)
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        # Clients of the socket are served in threads, the cache and the model are shared
+        self._lock = threading.Lock()
+
+    def _tag(self, tokens):
+        sentence = list(tokens) + [END_TOKEN] if self._end_token else list(tokens)
+        tags = self._model.do_viterbi(sentence)
+
+        return tuple(tags[:len(tokens)])
+
+    def tag(self, tokens):
+        """
+        Returns tuple of tags of the tokens.
+        """
+        start_time = time.perf_counter()
+        with self._lock:
+            tags = self._cache.get(tuple(tokens), self._tag)
+            self._latencies.append(time.perf_counter() - start_time)
+
+        return tags
+
+    def handle_line(self, line):
+        return " ".join(self.tag(line.split())) + "\n"
+
+    def get_requests(self):
+        return self._cache.get_hits() + self._cache.get_misses()
+
+    def get_stats(self):
+        """
+        Returns dictionary with number of requests, p50 and p99 latency in milliseconds
+        (of the last LATENCY_WINDOW requests) and cache hit rate.
+        """
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000
+            requests = self.get_requests()
+
+            return {"requests": requests, \
+                    "p50": float(np.percentile(latencies, 50)) if requests else 0.0, \
+                    "p99": float(np.percentile(latencies, 99)) if requests else 0.0, \
+                    "hit_rate": self._cache.get_hits() / requests if requests else 0.0}
+
+    def print_stats(self):
+        stats = self.get_stats()
+        print(f"Requests: {stats['requests']}, latency p50: {stats['p50']:.3f} ms, p99: {stats['p99']:.3f} ms, " \
+              f"cache hit rate: {stats['hit_rate']:.3f}", file=sys.stderr, flush=True)
+
+
+def serve_stream(service, input_stream, output_stream, report_every=0):
+    # Serve requests line by line until the end of input
+    for line in input_stream:
+        output_stream.write(service.handle_line(line))
+        output_stream.flush()
+
+        if report_every and service.get_requests() % report_every == 0:
+            service.print_stats()
+
+def serve_socket(service, socket_path, report_every=0):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                self.wfile.write(service.handle_line(line.decode("utf-8")).encode("utf-8"))
+                self.wfile.flush()
+
+                if report_every and service.get_requests() % report_every == 0:
+                    service.print_stats()
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    # Service is stopped by Ctrl+C or by kill, statistics are written in both cases
+    signal.signal(signal.SIGTERM, stop)
+
+    with socketserver.ThreadingUnixStreamServer(socket_path, Handler) as server:
+        print(f"Serving on {socket_path}...", file=sys.stderr, flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    """
+    Program starts here.
+    """
+
+    parser = argparse.ArgumentParser(description="Tagging service based on supervised HMM.")
+    parser.add_argument("-full_emissions", default=False, action='store_true', help="Flag to indicate should entries for not emissioned words by tags be added.")
+    parser.add_argument("-add_one", default=False, action='store_true', help="Flag to indicate add-one smoothing usage.")
+    parser.add_argument("-end_token", default=False, action='store_true', help="Flag to indicate usage of end token. Omit if don't want.")
+    parser.add_argument("-suffix_model", default=False, action='store_true', help="Flag to use suffix model for unknown words instead of emission 1.0.")
+    parser.add_argument("-config_path", default=None, type=str, help="Path to a trained config (.json or binary .npz) to use instead of training.")
+    parser.add_argument("-data_path", default="./data", type=str, help="Path to the directory with de-train.tt, used if config is not given.")
+    parser.add_argument("-cache_size", default=CACHE_SIZE, type=int, help="Maximum number of sentences with cached tags.")
+    parser.add_argument("-socket", default=None, type=str, help="Path to a Unix socket to serve on, stdin/stdout if omitted.")
+    parser.add_argument("-report_every", default=0, type=int, help="Write statistics to stderr after every n requests, 0 only at the end.")
+    args = parser.parse_args()
+
+    model = HMM(args.full_emissions, args.add_one, args.end_token, args.config_path, args.data_path, None)
+    if args.suffix_model:
+        model.build_suffix_model()
+    service = TaggingService(model, args.end_token, args.cache_size)
+
+    if args.socket:
+        serve_socket(service, args.socket, args.report_every)
+    else:
+        serve_stream(service, sys.stdin, sys.stdout, args.report_every)
+
+    service.print_stats()
@@ -0,0 +1,102 @@
+import numpy as np
+
+
+# Longest suffix of a word used by the model
+MAX_SUFFIX_LENGTH     = 5
+# Words at most this many times more frequent than the least frequent word are rare
+RARE_RATIO            = 10
+# Number of steps of the chain to estimate tag probabilities
+STATIONARY_ITERATIONS = 100
+
+
+class SuffixModel:
+    """
+    Model of emission probabilities of unknown words based on their suffixes (as in TnT tagger).
+    Unknown words are similar to rare words, so tag probabilities P(t|suffix) are estimated from rare
+    words ending with the suffix, separately for capitalized and not capitalized words.
+    Estimates for longer suffixes are smoothed with the shorter ones (successive abstraction):
+        P(t|s_1..s_i) = (P^(t|s_1..s_i) + theta * P(t|s_2..s_i)) / (1 + theta)
+    where theta is standard deviation of tag probabilities P(t).
+
+    The model is built from emission probabilities of a trained model (which may be read from a config),
+    word counts are not needed: tag probabilities are the stationary distribution of transitions,
+    and P(w|t) * P(t) is proportional to counts of (word, tag) of a maximum likelihood model.
+    """
+
+    def __init__(self, vocabulary, rows, columns, probs, initial_probs, transition_matrix, \
+                 max_length=MAX_SUFFIX_LENGTH, rare_ratio=RARE_RATIO):
+        """
+        Class constructor.
+        ...
+
+        Parameters:
+        -----------
+        vocabulary : list
+            Words with emission probabilities
+        rows, columns, probs : np.ndarray
+            Emission entries (state index, word index in vocabulary, probability)
+        initial_probs : np.ndarray
+            Transition probabilities from the initial state
+        transition_matrix : np.ndarray
+            Transition probabilities between states
+        max_length : int, optional
+            Longest suffix used
+        rare_ratio : float, optional
+            Words at most rare_ratio times more frequent than the least frequent word are rare
+        """
+        self._max_length = max_length
+
+        # Average distribution of tags over steps of the chain (it is stationary also for periodic chains)
+        tag_probs = initial_probs / max(initial_probs.sum(), np.finfo(np.float64).tiny)
+        stationary = np.zeros(len(tag_probs), dtype=np.float64)
+        for _ in range(STATIONARY_ITERATIONS):
+            tag_probs = tag_probs @ transition_matrix
+            stationary += tag_probs
+        self._tag_probs = stationary / stationary.sum()
+        self._theta = np.std(self._tag_probs)
+
+        weights = probs * self._tag_probs[rows]
+        frequencies = np.bincount(columns, weights=weights, minlength=len(vocabulary))
+        rare = (frequencies > 0) & (frequencies <= rare_ratio * frequencies[frequencies > 0].min(initial=np.inf))
+
+        self._suffix_index = dict()
+        suffix_ids = np.full((max_length, len(vocabulary)), -1, dtype=np.int64)
+        for word_id in np.flatnonzero(rare).tolist():
+            word = vocabulary[word_id]
+            for length in range(1, min(max_length, len(word)) + 1):
+                suffix_ids[length-1, word_id] = self._suffix_index.setdefault(suffix_key(word, length), len(self._suffix_index))
+
+        counts = np.zeros((len(self._suffix_index), len(self._tag_probs)), dtype=np.float64)
+        for length in range(max_length):
+            suffixes = suffix_ids[length, columns]
+            found = suffixes >= 0
+            np.add.at(counts, (suffixes[found], rows[found]), weights[found])
+        self._suffix_probs = counts / counts.sum(axis=1, keepdims=True)
+
+    def column(self, word):
+        """
+        Returns emission probabilities of the word for every state, up to a constant factor
+        (the highest one is 1.0, as of the crude unknown words handler).
+        """
+        probs = self._tag_probs
+        for length in range(1, min(self._max_length, len(word)) + 1):
+            suffix = self._suffix_index.get(suffix_key(word, length))
+            if suffix is None:
+                break
+
+            probs = (self._suffix_probs[suffix] + self._theta * probs) / (1 + self._theta)
+
+        # Bayes rule, P(word) is the same for all states: P(word|t) ~ P(t|suffix) / P(t)
+        column = np.divide(probs, self._tag_probs, out=np.zeros_like(probs), where=self._tag_probs > 0)
+
+        return column / column.max()
+
+    def get_tag_probs(self):
+        return self._tag_probs
+
+    def __len__(self):
+        return len(self._suffix_index)
+
+
+def suffix_key(word, length):
+    return word[0].isupper(), word[-length:]
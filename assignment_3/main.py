@@ -13,19 +13,34 @@ def main(args):
     print(WELCOME_MSG)
 
     init_grammar_time = time.time()
-    parser = Parser(args.gram_path)
+    parser = Parser(args.gram_path, args.grammar_cache)
     init_grammar_time = time.time() - init_grammar_time
 
     print("Start parsing...")
     parsing_time = time.time()
     
     # If sentence argument is provided then only the sentence will be parsed
-    if args.sent:
+    if args.sent and args.recognizer:
+        sentence = args.sent.split(' ')
+        print(f"In the language: {parser.recognize(sentence)}")
+        print(parser.count_parses(sentence))
+    elif args.sent and args.sample:
+        # Only sampled trees are built, not all of them
+        sentence = args.sent.split(' ')
+        print(parser.parse_sentence(sentence))
+        forest = parser.get_forest(len(sentence))
+        for _ in range(args.sample if len(forest) > 0 else 0):
+            tree = forest.sample()
+            if args.draw:
+                tree.draw()
+            else:
+                tree.pretty_print()
+    elif args.sent:
         sentence = args.sent.split(' ')
         print(parser.parse_sentence(sentence))
         parser.generate_parse_tree(len(sentence), args.draw)
     else:
-        parser.do_parsing(args.sents_path, args.result_file, args.trees_file)
+        parser.do_parsing(args.sents_path, args.result_file, args.trees_file, args.recognizer, args.workers)
 
     parsing_time = time.time() - parsing_time
     print("Finish parsing!")
@@ -37,10 +52,14 @@ def main(args):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="An implementation of CYK algorithm for sentence parsing.")
     parser.add_argument("-gram_path", default="./grammars/atis-grammar-cnf.cfg", type=str, help="File path of a grammar.")
+    parser.add_argument("-grammar_cache", default=None, type=str, help="Directory of compiled grammar cache, a grammar is compiled from text only if it is not cached yet.")
     parser.add_argument("-sents_path", default="./grammars/atis-test-sentences.txt", type=str, help="File path of test sentences.")
     parser.add_argument("-result_file", default="./outputs/result.txt", type=str, help="File where to write results of parsing test sentences.")
     parser.add_argument("-trees_file", default="./outputs/parsed_trees.json", type=str, help="File where to write all possible parsed trees for test sentences.")
     parser.add_argument("-sent", default=None, type=str, help="Sentence to be parsed.")
+    parser.add_argument("-sample", default=None, type=int, help="Number of parse trees of the sentence to sample uniformly instead of generating all.")
+    parser.add_argument("-recognizer", default=False, action='store_true', help="Flag to use the bitset recognizer, only parse counts are computed (no parse trees).")
+    parser.add_argument("-workers", default=1, type=int, help="Number of processes for parsing test sentences.")
     parser.add_argument("-draw", default=False, action='store_true', help="Flag to indicate if parse trees should be print or draw. Omit if don't want.")
     args = parser.parse_args()
 
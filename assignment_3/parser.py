@@ -1,6 +1,14 @@
+import io
+import os
 import nltk
 import json
+import random
+import hashlib
+import tempfile
+import contextlib
+import numpy as np
 from collections import deque
+from multiprocessing import Pool
 
 # For backpointers DS
 SYMBOL_PRODS      = 1
@@ -11,6 +19,49 @@ LEFT_NODE_SYMBOL  = 1
 RIGHT_NODE_NAME   = 2
 RIGHT_NODE_SYMBOL = 3
 
+# Compiled grammar cache, the version changes with the format of cache files
+CACHE_VERSION     = 1
+CACHE_SUFFIX      = ".npz"
+SYMBOLS           = "symbols"
+WORDS             = "words"
+LEXICON           = "lexicon"
+PRODUCTIONS       = "productions"
+START_WORDS       = "start_words"
+OFFSETS           = "_offsets"
+VERSION           = "version"
+
+
+def encode_strings(strings):
+    """
+    Returns UTF-8 bytes of all strings joined (uint8 array) and offsets of strings (in characters),
+    a compact replacement of NumPy unicode arrays which pad every string to the longest one.
+    """
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in strings], out=offsets[1:])
+
+    return np.frombuffer("".join(strings).encode("utf-8"), dtype=np.uint8), offsets
+
+def decode_strings(data, offsets):
+    # Decoded at once, strings are then sliced out by character offsets
+    text = data.tobytes().decode("utf-8")
+    offsets = offsets.tolist()
+
+    return [text[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def _init_worker(parser, recognizer):
+    global _worker_parser, _worker_recognizer
+    _worker_parser = parser
+    _worker_recognizer = recognizer
+
+def _parse_task(task):
+    # Trees are printed by the main process, in order of sentences
+    index, sentence = task
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        result = _worker_parser._parse_one(sentence, _worker_recognizer)
+
+    return index, result, output.getvalue()
+
 
 class Node:
     """
@@ -19,8 +70,8 @@ class Node:
     Nodes are used to store information about backpointers
     for every possible path from a node. Backpointers are then used 
     in parsing phase to generate all  possible trees from the start symbol. 
-    It is dict data structure, KEY is nonterminal symbol of a grammar, 
-    while VALUE is list.
+    It is dict data structure, KEY is ID of a nonterminal symbol of a grammar
+    (see Parser._compile_grammar), while VALUE is list.
     Elements of list for every KEY are:
         index 0 - number of all possible subtrees from a node using 
                   KEY symbol
@@ -28,12 +79,12 @@ class Node:
                   pair of nodes which can be visited from the current node.
                   Order in a tuple is:
                     index 0 - left node that can be visited
-                    index 1 - nonterminal symbol for the left node
+                    index 1 - nonterminal ID for the left node
                     index 2 - right node that can be visited
-                    index 3 - nonterminal symbol for the right node
+                    index 3 - nonterminal ID for the right node
     Note: for leaf nodes, VALUE is not list but single terminal symbols.
     Example of backpointers data structure:
-    {SIGMA: [3, [('node_0_1', VERB_MD, 'node_1_14', BJG)]]}
+    {0: [3, [('node_0_1', 12, 'node_1_14', 37)]]}
 
     Terminal attribute is a bool value to make distinction between 
     leaf and internal nodes.
@@ -82,20 +133,322 @@ class Node:
                  Backpointers: {self._backpointers}\n"""
 
 
+class ParseForest:
+    """
+    Class represents all parse trees of a sentence packed in nodes of the CKY algorithm.
+
+    Trees are not built in advance. The forest only follows backpointers
+    of nodes and uses stored numbers of subtrees, so it can give the number of trees,
+    yield trees one at a time, build the k-th tree or sample trees uniformly.
+    Order of trees is the order in which backpointers were stored: for every
+    backpointer, all left subtrees and for each of them all right subtrees.
+
+    Trees (nltk.Tree) have the same form as trees of generate_parse_tree had before:
+    a subtree is below a node with its own symbol and words are quoted, e.g.
+    (SIGMA (NOUN_NNS 'prices') (pt_char_per '.')).
+    """
+
+    def __init__(self, nodes, symbols, root_name, root_symbol):
+        self._nodes = nodes
+        self._symbols = symbols
+        self._root_name = root_name
+        self._root_symbol = root_symbol
+
+    def get_count(self):
+        return self._nodes[self._root_name].get_subtrees_total_count()
+
+    def __len__(self):
+        return self.get_count()
+
+    def __iter__(self):
+        if self.get_count() == 0:
+            return iter(())
+
+        return self._iter_trees(self._root_name, self._root_symbol)
+
+    def get_tree(self, index):
+        """
+        Method to build one parse tree without building the others.
+        Subtrees are chosen using numbers of subtrees of every backpointer.
+        ...
+
+        Parameters:
+        -----------
+        index : int
+            Index of a tree in order of iteration.
+
+        Return:
+        -------
+        nltk.Tree
+            The tree on the index.
+        """
+        if not 0 <= index < self.get_count():
+            raise IndexError(f"Tree index {index} out of range, there are {self.get_count()} trees!")
+
+        return self._tree_at(self._root_name, self._root_symbol, index)
+
+    def sample(self, rng=random):
+        """
+        Method to sample a parse tree, all trees have the same probability.
+        ...
+
+        Parameters:
+        -----------
+        rng : random.Random (optional)
+            Random generator, by default the one of random module.
+
+        Return:
+        -------
+        nltk.Tree
+            Sampled tree.
+        """
+        if self.get_count() == 0:
+            raise IndexError("There are no trees to sample!")
+
+        return self.get_tree(rng.randrange(self.get_count()))
+
+    def _leaf_tree(self, node, symbol):
+        # Leaf value is a word, or productions of the start symbol for one word sentences
+        value = node.get_productions(symbol)[SYMBOL_PRODS]
+        words = [value] if isinstance(value, str) else [prod.rhs()[0] for prod in value]
+
+        return nltk.Tree(str(self._symbols[symbol]), [repr(word) for word in words])
+
+    def _subtree_count(self, node_name, symbol):
+        return self._nodes[node_name].get_production_count(symbol)
+
+    def _join(self, symbol, prod, left_tree, right_tree):
+        left_symbol, right_symbol = self._symbols[prod[LEFT_NODE_SYMBOL]], self._symbols[prod[RIGHT_NODE_SYMBOL]]
+        if not self._nodes[prod[LEFT_NODE_NAME]].is_terminal():
+            left_tree = nltk.Tree(str(left_symbol), [left_tree])
+        if not self._nodes[prod[RIGHT_NODE_NAME]].is_terminal():
+            right_tree = nltk.Tree(str(right_symbol), [right_tree])
+
+        return nltk.Tree(str(self._symbols[symbol]), [left_tree, right_tree])
+
+    def _iter_trees(self, node_name, symbol):
+        node = self._nodes[node_name]
+
+        # Base case
+        if node.is_terminal():
+            yield self._leaf_tree(node, symbol)
+            return
+
+        for prod in node.get_productions(symbol)[SYMBOL_PRODS]:
+            for left_tree in self._iter_trees(prod[LEFT_NODE_NAME], prod[LEFT_NODE_SYMBOL]):
+                for right_tree in self._iter_trees(prod[RIGHT_NODE_NAME], prod[RIGHT_NODE_SYMBOL]):
+                    yield self._join(symbol, prod, left_tree, right_tree)
+
+    def _tree_at(self, node_name, symbol, index):
+        node = self._nodes[node_name]
+
+        # Base case
+        if node.is_terminal():
+            return self._leaf_tree(node, symbol)
+
+        for prod in node.get_productions(symbol)[SYMBOL_PRODS]:
+            right_count = self._subtree_count(prod[RIGHT_NODE_NAME], prod[RIGHT_NODE_SYMBOL])
+            prod_count = self._subtree_count(prod[LEFT_NODE_NAME], prod[LEFT_NODE_SYMBOL]) * right_count
+
+            if index < prod_count:
+                left_tree = self._tree_at(prod[LEFT_NODE_NAME], prod[LEFT_NODE_SYMBOL], index // right_count)
+                right_tree = self._tree_at(prod[RIGHT_NODE_NAME], prod[RIGHT_NODE_SYMBOL], index % right_count)
+
+                return self._join(symbol, prod, left_tree, right_tree)
+            index -= prod_count
+
+
 class Parser:
     """
     Main class responsible for the CKY algorithm.
+
+    The grammar is compiled once, when a parser is created, into integer
+    nonterminal IDs and two indices used by parse_sentence:
+        - binary rules, (left ID, right ID) -> list of (production index, parent ID)
+        - lexicon, word -> list of preterminal IDs
+    The production index is position of a production in the grammar, it keeps
+    backpointers (and so generated trees) in the order of the grammar.
+
+    For the recognizer (see recognize and count_parses) binary rules are also
+    stored as arrays of left, right and parent IDs sorted by (left, right), and
+    for every left symbol a bit vector of right symbols it has rules with.
+    A cell of the chart is then a bit vector over nonterminal IDs and
+    cells are combined for all splits at once with numpy.
+
+    With cache_dir, the compiled grammar is stored in (and later read from)
+    a cache file named by SHA-256 of the grammar file, so the text of the grammar
+    is not parsed again (see _load_grammar_cache).
     """
 
-    def __init__(self, grammar_path):
+    def __init__(self, grammar_path, cache_dir=None):
         print("Loading grammar...")
-        self._grammar = nltk.data.load(grammar_path)
         self._nodes = dict()
+        self._chart = None
+        self._chart_lefts = None
+        self._chart_bits = None
+
+        if cache_dir is None:
+            self._set_grammar(*self._compile_grammar(nltk.data.load(grammar_path)))
+        else:
+            self._load_grammar_cache(grammar_path, cache_dir)
+
+    def _compile_grammar(self, grammar):
+        """
+        Method to compile a grammar into arrays, which are used to build indices
+        of the parser (see _set_grammar) and are stored in the grammar cache.
+        ...
 
-    def do_parsing(self, file_path, result_file, trees_file):
+        Parameters:
+        -----------
+        grammar : nltk.CFG
+            Grammar in CNF.
+
+        Return:
+        -------
+        symbols : list
+            Names of nonterminal symbols, the index is ID of a symbol.
+        words : list
+            Words of the lexicon.
+        lexicon, lexicon_offsets : np.ndarray
+            Preterminal IDs of all words, lexicon[lexicon_offsets[i]:lexicon_offsets[i+1]] are of the i-th word.
+        productions : np.ndarray
+            Binary productions, rows are (production index, left ID, right ID, parent ID).
+        start_words : list
+            Words of lexical productions of the start symbol, once per production.
+        """
+        start = grammar.start()
+        # Start symbol always gets ID 0
+        symbol_ids = {start: 0}
+        for prod in grammar.productions():
+            symbol_ids.setdefault(prod.lhs(), len(symbol_ids))
+            for symbol in prod.rhs():
+                if isinstance(symbol, nltk.Nonterminal):
+                    symbol_ids.setdefault(symbol, len(symbol_ids))
+
+        lexicon = dict()
+        productions = list()
+        start_words = list()
+        for index, prod in enumerate(grammar.productions()):
+            lhs_id = symbol_ids[prod.lhs()]
+            rhs = prod.rhs()
+
+            if len(rhs) > 0 and isinstance(rhs[0], str):
+                preterminals = lexicon.setdefault(rhs[0], list())
+                if lhs_id not in preterminals:
+                    preterminals.append(lhs_id)
+                if lhs_id == 0:
+                    start_words.append(rhs[0])
+            elif len(rhs) == 2:
+                productions.append((index, symbol_ids[rhs[0]], symbol_ids[rhs[1]], lhs_id))
+
+        lexicon_offsets = np.zeros(len(lexicon) + 1, dtype=np.int64)
+        np.cumsum([len(preterminals) for preterminals in lexicon.values()], out=lexicon_offsets[1:])
+        lexicon_ids = np.array([lhs_id for preterminals in lexicon.values() for lhs_id in preterminals], dtype=np.int64)
+
+        return [symbol.symbol() for symbol in symbol_ids], list(lexicon), lexicon_ids, lexicon_offsets, \
+               np.array(productions, dtype=np.int64).reshape(-1, 4), start_words
+
+    def _set_grammar(self, symbols, words, lexicon, lexicon_offsets, productions, start_words):
+        """
+        Method to build indices of the parser from a compiled grammar (see _compile_grammar).
+        """
+        self._symbols = [nltk.Nonterminal(symbol) for symbol in symbols]
+        self._symbol_ids = {symbol: symbol_id for symbol_id, symbol in enumerate(self._symbols)}
+        self._start_id = 0
+
+        lexicon = lexicon.tolist()
+        lexicon_offsets = lexicon_offsets.tolist()
+        self._lexicon = {word: lexicon[start:end] for word, start, end in zip(words, lexicon_offsets[:-1], lexicon_offsets[1:])}
+
+        # Productions of the start symbol for one word sentences
+        self._start_productions = dict()
+        for word in start_words:
+            self._start_productions.setdefault(word, list()).append(nltk.Production(self._symbols[self._start_id], [word]))
+
+        self._binary_rules = dict()
+        self._right_ids = dict()
+        for index, left_id, right_id, lhs_id in productions.tolist():
+            self._binary_rules.setdefault((left_id, right_id), list()).append((index, lhs_id))
+            self._right_ids.setdefault(left_id, set()).add(right_id)
+
+        # The last node (node_0_[sent_len]) only uses productions with the start symbol on lhs
+        self._start_rules = dict()
+        for pair, parents in self._binary_rules.items():
+            parents = [parent for parent in parents if parent[1] == self._start_id]
+            if parents:
+                self._start_rules[pair] = parents
+
+        # Rule arrays for the recognizer, sorted by (left, right) symbols.
+        # Duplicated rules are kept so parse counts are the same.
+        rules = productions[np.lexsort((productions[:, 3], productions[:, 2], productions[:, 1]))]
+        self._rule_lefts, self._rule_rights, self._rule_parents = rules[:, 1:].T.copy()
+        self._rule_keys = self._rule_lefts * len(self._symbols) + self._rule_rights
+        # Symbols on the left side of rules and, as rows of a bit matrix, right symbols of their rules
+        self._left_ids, left_index = np.unique(self._rule_lefts, return_inverse=True)
+        # Bit vectors are padded to whole 64 bit words
+        right_masks = np.zeros((len(self._left_ids), -(-len(self._symbols) // 64) * 64), dtype=bool)
+        right_masks[left_index, self._rule_rights] = True
+        self._right_masks = np.packbits(right_masks, axis=-1).view(np.uint64)
+
+    def _load_grammar_cache(self, grammar_path, cache_dir):
+        """
+        Method to set up the parser from the compiled grammar cache.
+        Cache files are named by SHA-256 of the grammar file, so a changed grammar
+        is never read from an old cache file. If the grammar is not cached yet
+        (or it was cached by another version), it is compiled and written to the cache.
+        ...
+
+        Parameters:
+        -----------
+        grammar_path : str
+            File path of a grammar.
+        cache_dir : str
+            Directory of cache files.
+        """
+        digest = hashlib.sha256(nltk.data.load(grammar_path, format="raw", cache=False)).hexdigest()
+        cache_path = os.path.join(cache_dir, digest + CACHE_SUFFIX)
+
+        if os.path.isfile(cache_path):
+            with np.load(cache_path) as cache:
+                arrays = {name: cache[name] for name in cache.files}
+
+            if arrays[VERSION] == CACHE_VERSION:
+                self._set_grammar(decode_strings(arrays[SYMBOLS], arrays[SYMBOLS + OFFSETS]), \
+                                  decode_strings(arrays[WORDS], arrays[WORDS + OFFSETS]), \
+                                  arrays[LEXICON], arrays[LEXICON + OFFSETS], arrays[PRODUCTIONS], \
+                                  decode_strings(arrays[START_WORDS], arrays[START_WORDS + OFFSETS]))
+                return
+
+        compiled = self._compile_grammar(nltk.data.load(grammar_path))
+        self._set_grammar(*compiled)
+        symbols, words, lexicon, lexicon_offsets, productions, start_words = compiled
+
+        arrays = {VERSION: np.array(CACHE_VERSION), LEXICON: lexicon, LEXICON + OFFSETS: lexicon_offsets, PRODUCTIONS: productions}
+        for name, strings in ((SYMBOLS, symbols), (WORDS, words), (START_WORDS, start_words)):
+            arrays[name], arrays[name + OFFSETS] = encode_strings(strings)
+
+        # Written into a temporary file first, so parallel runs never read a half written cache
+        os.makedirs(cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=cache_dir, suffix=CACHE_SUFFIX, delete=False) as cache_file:
+            np.savez(cache_file, **arrays)
+        os.chmod(cache_file.name, 0o644)
+        os.replace(cache_file.name, cache_path)
+
+    def get_symbol(self, symbol_id):
+        return self._symbols[symbol_id]
+
+    def get_symbol_id(self, symbol):
+        return self._symbol_ids[symbol]
+
+    def do_parsing(self, file_path, result_file, trees_file, recognizer=False, workers=1):
         """
         Wrapper method around parse_sentence method
         to do parsing for more sentences.
+        With recognizer, only parse counts are computed (see count_parses)
+        and no parse trees are generated.
+        Results are written as soon as they are ready, in order of sentences.
+        With more workers, sentences are parsed in a pool of processes,
+        every process has its own copy of the parser with the compiled grammar.
         ...
 
         Parameters:
@@ -106,22 +459,67 @@ class Parser:
             Path to a file where to write results.
         trees_file : str
             Path to a file where to store parsed trees.
+        recognizer : bool (optional)
+            Flag to use the bitset recognizer instead of backpointers.
+        workers : int (optional)
+            Number of processes.
         """
-        result = list()
-        parsed_trees = dict()
-
         sents = nltk.data.load(file_path)
-        test_sents = nltk.parse.util.extract_test_sentences(sents)
+        test_sents = [sent[0] for sent in nltk.parse.util.extract_test_sentences(sents)]
 
-        for sent in test_sents:
-            result.append(" ".join(sent[0]) + "\t" + str(self.parse_sentence(sent[0])))
-            parsed_trees[" ".join(sent[0])] = self.generate_parse_tree(len(sent[0]))
+        if workers > 1:
+            results = self._parse_parallel(test_sents, recognizer, workers)
+        else:
+            results = (self._parse_one(sentence, recognizer) for sentence in test_sents)
 
         with open(result_file, 'w', encoding="utf-8") as writer:
-            writer.write("\n".join(result))
+            if recognizer:
+                for index, (sentence, count, _) in enumerate(results):
+                    writer.write(("\n" if index > 0 else "") + sentence + "\t" + str(count))
+                return
+
+            # Trees file is the json of dict {sentence: trees}, written entry by entry.
+            # Trees of a repeated sentence are the same, so they are written once.
+            parsed = set()
+            with open(trees_file, 'w') as json_file:
+                json_file.write("{")
+                for index, (sentence, count, trees) in enumerate(results):
+                    writer.write(("\n" if index > 0 else "") + sentence + "\t" + str(count))
+
+                    if sentence not in parsed:
+                        json_file.write((", " if parsed else "") + json.dumps(sentence) + ": " + trees)
+                        parsed.add(sentence)
+                json_file.write("}")
+
+    def _parse_one(self, sentence, recognizer):
+        # Returns (sentence, number of parse trees, json of parse trees)
+        if recognizer:
+            return " ".join(sentence), self.count_parses(sentence), None
+
+        count = self.parse_sentence(sentence)
+
+        return " ".join(sentence), count, json.dumps(self.generate_parse_tree(len(sentence)))
+
+    def _parse_parallel(self, sentences, recognizer, workers):
+        """
+        Generator of results of _parse_one for sentences parsed in a pool of processes.
+        The longest sentences are parsed first, so the last ones to finish are short.
+        Results are yielded in order of sentences, the ones that finish
+        before their turn wait in a buffer.
+        """
+        order = sorted(range(len(sentences)), key=lambda index: len(sentences[index]), reverse=True)
+        finished = dict()
+        next_index = 0
 
-        with open(trees_file, 'w') as json_file:
-            json.dump(parsed_trees, json_file)
+        with Pool(workers, initializer=_init_worker, initargs=(self, recognizer)) as pool:
+            for index, result, output in pool.imap_unordered(_parse_task, ((index, sentences[index]) for index in order)):
+                finished[index] = (result, output)
+
+                while next_index in finished:
+                    result, output = finished.pop(next_index)
+                    print(output, end="")
+                    yield result
+                    next_index += 1
 
     def parse_sentence(self, sentence):
         """
@@ -155,13 +553,11 @@ class Parser:
 
             # Special case if length is just one word.
             if sent_len == 1:
-                start = self._grammar.start()
-                new_node.set_backpointers({start: \
-                                            (1, self._grammar.productions(lhs=start, rhs=word))})
+                new_node.set_backpointers({self._start_id: \
+                                            (1, self._start_productions.get(word, list()))})
             else:
-                new_node.set_backpointers({prod.lhs(): \
-                                          (1, prod.rhs()[0]) \
-                                            for prod in self._grammar.productions(rhs=word)})
+                new_node.set_backpointers({preterminal: (1, word) \
+                                            for preterminal in self._lexicon.get(word, ())})
             new_node.update_subtrees_total_count(len(new_node.get_backpointers()))
             self._nodes[new_node.get_name()] = new_node
 
@@ -169,6 +565,9 @@ class Parser:
         # All other nodes that correspodent to lengths > 1 sentence sequences
         # Sequence length
         for length in range(2, sent_len + 1):
+            # For the last node (node_0_[sent_len]) only productions with SIGMA on lhs
+            rules = self._start_rules if length == sent_len else self._binary_rules
+
             # Start position of sequence
             for start_pos in range(sent_len - length + 1):
                 new_node = Node(self._create_node_name(start_pos, start_pos+length))
@@ -178,39 +577,222 @@ class Parser:
                 for left_offset in range(1, length):
                     left_node = self._nodes[self._create_node_name(start_pos, start_pos+left_offset)]
                     right_node = self._nodes[self._create_node_name(start_pos+left_offset, start_pos+length)]
-                    
-                    # Find all possible productions from the current node to
-                    # left and right nodes among all in grammar
-                    # such that rhs is -> ln_lhs prod.rhs()[1].
-                    # ln_lhs is a KEY in left_node backpointers (nonterminal symbol)
-                    # prod.rhs()[1] is a right symbol on rhs of production which has ln_lhs as left symbol
-                    for ln_lhs in left_node.get_backpointers():
-                        for prod in self._grammar.productions(rhs=ln_lhs):
-                            if prod.rhs()[1] in right_node.get_backpointers():
-
-                                # For the last node (node_0_[sent_len]) only productions with SIGMA on lhs
-                                if length == sent_len and prod.lhs() != self._grammar.start():
-                                    continue
-
-                                new_node_prod = prod.lhs()
-                                prod_nodes = (left_node.get_name(), ln_lhs, right_node.get_name(), prod.rhs()[1])
-                                # Calculate number of all possible subtrees from the current node
-                                # using the current production
-                                prod_count = left_node.get_production_count(ln_lhs) \
-                                            * right_node.get_production_count(prod.rhs()[1])
-                                
-                                if not new_node_prod in backpointers:
-                                    backpointers[new_node_prod] = [0, list()]
-                                backpointers[new_node_prod][0] += prod_count
-                                backpointers[new_node_prod][1].append(prod_nodes)
-
-                                new_node.update_subtrees_total_count(prod_count)
+                    left_backpointers = left_node.get_backpointers()
+                    right_backpointers = right_node.get_backpointers()
+
+                    # Find all productions X -> ln_lhs rn_lhs with ln_lhs a KEY
+                    # in left_node backpointers and rn_lhs a KEY in right_node backpointers.
+                    # Matches are sorted by index of production to follow order of the grammar.
+                    for ln_lhs in left_backpointers:
+                        right_ids = self._right_ids.get(ln_lhs)
+                        if not right_ids:
+                            continue
+
+                        matches = list()
+                        for rn_lhs in right_ids.intersection(right_backpointers):
+                            for index, new_node_prod in rules.get((ln_lhs, rn_lhs), ()):
+                                matches.append((index, new_node_prod, rn_lhs))
+                        matches.sort()
+
+                        for _, new_node_prod, rn_lhs in matches:
+                            prod_nodes = (left_node.get_name(), ln_lhs, right_node.get_name(), rn_lhs)
+                            # Calculate number of all possible subtrees from the current node
+                            # using the current production
+                            prod_count = left_backpointers[ln_lhs][0] * right_backpointers[rn_lhs][0]
+
+                            if not new_node_prod in backpointers:
+                                backpointers[new_node_prod] = [0, list()]
+                            backpointers[new_node_prod][0] += prod_count
+                            backpointers[new_node_prod][1].append(prod_nodes)
+
+                            new_node.update_subtrees_total_count(prod_count)
 
                 new_node.set_backpointers(backpointers)
                 self._nodes[new_node.get_name()] = new_node
 
         return self._nodes[self._create_node_name(0, sent_len)].get_subtrees_total_count()
 
+    def recognize(self, sentence):
+        """
+        Recognizer-only version of parse_sentence, no backpointers are stored.
+        Chart is a boolean array of shape (sent_len, sent_len+1, number of nonterminals),
+        chart[i, j] is the set of nonterminals that can generate words i..j-1.
+        The same chart is also kept with cells packed into bits (see _find_rules).
+        All cells of the same length and all their splits are combined at once.
+        ...
+
+        Parameters:
+        -----------
+        sentence : list
+            Tokenized sentence to be processed.
+
+        Return:
+        -------
+        bool
+            True if the sentence can be generated from the start symbol.
+        """
+        sent_len = len(sentence)
+        # Check for empty sentence
+        if sent_len == 0:
+            self._chart = None
+            self._chart_lefts = None
+            self._chart_bits = None
+            return False
+
+        chart = np.zeros((sent_len, sent_len + 1, self._right_masks.shape[1] * 64), dtype=bool)
+        # Left symbols of cells and cells packed into bits
+        chart_lefts = np.zeros((sent_len, sent_len + 1, len(self._left_ids)), dtype=bool)
+        chart_bits = np.zeros((sent_len, sent_len + 1, self._right_masks.shape[1]), dtype=np.uint64)
+
+        for length in range(1, sent_len + 1):
+            cells = np.arange(sent_len - length + 1)
+            if length == 1:
+                for index, word in enumerate(sentence):
+                    chart[index, index + 1, self._lexicon.get(word, [])] = True
+            else:
+                starts, splits, ends = self._cell_splits(sent_len, length)
+                split_index, rule_index = self._find_rules(chart_lefts, chart_bits, starts, splits, ends)
+                chart[starts[split_index], ends[split_index], self._rule_parents[rule_index]] = True
+
+            chart_lefts[cells, cells + length] = chart[cells, cells + length][:, self._left_ids]
+            chart_bits[cells, cells + length] = np.packbits(chart[cells, cells + length], axis=-1).view(np.uint64)
+
+        self._chart = chart[..., :len(self._symbols)]
+        self._chart_lefts = chart_lefts
+        self._chart_bits = chart_bits
+
+        return bool(chart[0, sent_len, self._start_id])
+
+    def count_parses(self, sentence):
+        """
+        Number of parse trees of a sentence, computed from the chart of recognize.
+        First, symbols of cells reachable from the start symbol in node_0_[sent_len]
+        are found going top-down, then parse trees are counted bottom-up only for them.
+        Counts are the same as counts of parse_sentence, except for one word sentences:
+        parse_sentence always gives 1 for them, here it is 1 only if the start symbol
+        has a production to the word (e.g. "flights" gives 1, "." gives 0).
+        ...
+
+        Parameters:
+        -----------
+        sentence : list
+            Tokenized sentence to be processed.
+
+        Return:
+        -------
+        int
+            Number of all possible parse trees.
+        """
+        if not self.recognize(sentence):
+            return 0
+
+        chart = self._chart
+        sent_len = len(sentence)
+        reachable = np.zeros_like(chart)
+        reachable[0, sent_len, self._start_id] = True
+
+        # Top-down, rules used by reachable symbols are kept for counting
+        # as flat indices of (parent, left, right) symbols in the chart
+        used_rules = list()
+        for length in range(sent_len, 1, -1):
+            starts, splits, ends = self._cell_splits(sent_len, length)
+            # Only cells with a reachable symbol
+            cells = reachable[starts, ends].any(axis=1)
+            starts, splits, ends = starts[cells], splits[cells], ends[cells]
+            split_index, rule_index = self._find_rules(self._chart_lefts, self._chart_bits, starts, splits, ends)
+            starts, splits, ends = starts[split_index], splits[split_index], ends[split_index]
+            parents = self._rule_parents[rule_index]
+            lefts, rights = self._rule_lefts[rule_index], self._rule_rights[rule_index]
+
+            used = reachable[starts, ends, parents]
+            reachable[starts[used], splits[used], lefts[used]] = True
+            reachable[splits[used], ends[used], rights[used]] = True
+            starts, splits, ends = starts[used], splits[used], ends[used]
+            used_rules.append((np.ravel_multi_index((starts, ends, parents[used]), chart.shape),
+                               np.ravel_multi_index((starts, splits, lefts[used]), chart.shape),
+                               np.ravel_multi_index((splits, ends, rights[used]), chart.shape)))
+
+        # Bottom-up, counts are python ints (object array) so they can't overflow.
+        # Reachable symbols of length 1 cells have exactly one subtree.
+        items = np.flatnonzero(reachable)
+        starts, ends, _ = np.unravel_index(items, chart.shape)
+        counts = (ends - starts == 1).astype(np.int64).astype(object)
+        for rules in reversed(used_rules):
+            parents, lefts, rights = (np.searchsorted(items, symbols) for symbols in rules)
+            np.add.at(counts, parents, counts[lefts] * counts[rights])
+
+        return int(counts[np.searchsorted(items, np.ravel_multi_index((0, sent_len, self._start_id), chart.shape))])
+
+    def _cell_splits(self, sent_len, length):
+        # Flat arrays of (start, split, end) for all cells of a length and all their splits
+        starts = np.repeat(np.arange(sent_len - length + 1), length - 1)
+        splits = starts + np.tile(np.arange(1, length), sent_len - length + 1)
+
+        return starts, splits, starts + length
+
+    def _find_rules(self, chart_lefts, chart_bits, starts, splits, ends):
+        """
+        Vectorized search of rules X -> B C for many splits at once,
+        where B is in the left cell chart[start, split] and C in the right cell chart[split, end].
+        For every B in a left cell, its bit vector of right symbols is and-ed
+        with the right cell, so only rules with both symbols in the chart are visited.
+        ...
+
+        Parameters:
+        -----------
+        chart_lefts : np.ndarray
+            Boolean chart of recognize, only symbols on the left side of rules.
+        chart_bits : np.ndarray
+            The whole chart with cells packed into 64 bit words.
+        starts, splits, ends : np.ndarray
+            Flat arrays of positions, one element per split.
+
+        Return:
+        -------
+        split_index : np.ndarray
+            Index of a split for every rule found.
+        rule_index : np.ndarray
+            Index of a rule in the rule arrays.
+        """
+        split_index, left_index = np.nonzero(chart_lefts[starts, splits])
+
+        # Right symbols, as (row, word, bit), of B C pairs present in the chart
+        matched = self._right_masks[left_index] & chart_bits[splits[split_index], ends[split_index]]
+        row, word = np.nonzero(matched)
+        match, bit = np.nonzero(np.unpackbits(matched[row, word].view(np.uint8).reshape(-1, 8), axis=1))
+        row = row[match]
+        keys = self._left_ids[left_index[row]] * len(self._symbols) + word[match] * 64 + bit
+
+        # Expand B C pairs into ranges of their rules (more than one rule if a pair has more parents)
+        first = np.searchsorted(self._rule_keys, keys, side='left')
+        rules_num = np.searchsorted(self._rule_keys, keys, side='right') - first
+        range_starts = np.repeat(first - np.cumsum(rules_num) + rules_num, rules_num)
+        rule_index = range_starts + np.arange(rules_num.sum())
+
+        return np.repeat(split_index[row], rules_num), rule_index
+
+    def get_chart(self):
+        return self._chart
+
+    def get_forest(self, n):
+        """
+        Method to get parse trees of the last parsed sentence as a forest,
+        no tree is built until the forest is asked for it (see ParseForest).
+        ...
+
+        Parameters:
+        -----------
+        n : int
+            Length of parsed sentence.
+
+        Return:
+        -------
+        ParseForest
+            Forest of all possible parse trees.
+        """
+        # Nodes are copied, so the forest stays valid when another sentence is parsed
+        return ParseForest(dict(self._nodes), self._symbols, self._create_node_name(0, n), self._start_id)
+
     def generate_parse_tree(self, n, draw=False):
         """
         Method to generate a parse trees using backpointers from nodes.
@@ -233,18 +815,12 @@ class Parser:
             return False
 
         # Generate all possible parse trees
-        trees = self._collect_trees(self._create_node_name(0, n), self._grammar.start())
+        trees = list(self.get_forest(n))
 
         if not trees:
             print("Oh, there are no trees.")
 
             return trees
-        
-        # Process trees to be in the right form
-        trees = [str(tree).replace(',', '') for tree in trees]
-
-        # Create tree objects from strings
-        trees = [nltk.Tree.fromstring(tree, brackets="[]") for tree in trees]
 
         for tree in trees:
             if draw:
@@ -258,50 +834,6 @@ class Parser:
     def _create_node_name(self, left, right):
         return f"node_{left}_{right}"
 
-    def _collect_trees(self, node_name, symbol):
-        """
-        Main method for generating parse trees.
-        Recursively going from the last node (node_0_[sent_len]) and
-        follow backpointers to leaves.
-        ...
-
-        Parameters:
-        -----------
-        node_name : str
-            Name of the current node.
-        symbol : nonterminal
-            Nonterminal symbol of grammar.
-
-        Return:
-        -------
-        curr_trees : list
-            List of possible parse trees.
-        """
-        node = self._nodes[node_name]
-
-        if node.get_subtrees_total_count() == 0:
-            return list()
-
-        # Base case
-        if node.is_terminal():
-            return [node.get_productions(symbol)[SYMBOL_PRODS]]
-
-        curr_trees = list()
-        for prod in node.get_productions(symbol)[SYMBOL_PRODS]:
-            # Go to left subtrees
-            left_trees = self._collect_trees(prod[LEFT_NODE_NAME], prod[LEFT_NODE_SYMBOL])
-            # Go to right subtrees
-            right_trees = self._collect_trees(prod[RIGHT_NODE_NAME], prod[RIGHT_NODE_SYMBOL])
-
-            # Combine left and right subtrees
-            for left_tree in left_trees:
-                for right_tree in right_trees:
-                    curr_trees.append([symbol,
-                                      [prod[LEFT_NODE_SYMBOL], left_tree],
-                                      [prod[RIGHT_NODE_SYMBOL], right_tree]])
-
-        return curr_trees
-
     def print_nodes(self, to_file=False):
         """
         Helper method used to check if nodes are correct.